@@ -0,0 +1,210 @@
+import argparse, json, sys
+
+import cache
+from chip8 import Chip8, DECODE
+from disasm import disassemble
+
+
+SKIPS = {"op_se_vx_kk", "op_sne_vx_kk", "op_se_vx_vy", "op_sne_vx_vy", "op_skp", "op_sknp"}
+
+# instructions after which execution does not simply fall through
+ENDS = SKIPS | {"op_jp", "op_call", "op_ret", "op_jp_v0", "op_unimplemented"}
+
+
+# where control can go after the instruction at pc
+def successors(name, pc, n):
+    match name:
+        case "op_jp":
+            return [n]
+        case "op_call":
+            return [n, pc + 2]
+        case "op_ret" | "op_jp_v0" | "op_unimplemented":
+            return []
+        case _ if name in SKIPS:
+            return [pc + 2, pc + 4]
+        case _:
+            return [pc + 2]
+
+
+# static analysis of a rom as loaded at 0x200: the reachable code split
+# into basic blocks, the rom bytes never reached as code, and stores whose
+# target is known from an Annn earlier in the same block and hits code
+def analyze(rom: bytes) -> dict:
+    ram = Chip8(rom).ram
+    rom_end = 0x200 + len(rom)
+
+    code = set()
+    leaders = {0x200}
+    calls = set()
+    indirect = []
+    invalid = []
+
+    todo = [0x200]
+    while todo:
+        pc = todo.pop()
+        if pc in code:
+            continue
+        if pc >= 0xFFF:
+            invalid.append(pc)
+            continue
+        code.add(pc)
+
+        op = (ram[pc] << 8) | ram[pc + 1]
+        fn, x, y, n = DECODE[op]
+        name = fn.__name__
+
+        if name == "op_unimplemented":
+            invalid.append(pc)
+        elif name == "op_jp_v0":
+            indirect.append(pc)
+        elif name == "op_call":
+            calls.add(n)
+
+        succ = successors(name, pc, n)
+        if name in ENDS:
+            leaders.update(succ)
+        todo += succ
+
+    # split the reachable code at every leader
+    blocks = []
+    loops = set()
+    for start in sorted(leaders & code):
+        pc = start
+        while True:
+            fn, x, y, n = DECODE[(ram[pc] << 8) | ram[pc + 1]]
+            name = fn.__name__
+            pc += 2
+            if name in ENDS:
+                succ = successors(name, pc - 2, n)
+                break
+            if pc in leaders or pc not in code:
+                succ = [pc]
+                break
+
+        blocks.append({"start": start, "end": pc, "succ": succ})
+        loops.update(s for s in succ if s <= start)
+
+    covered = bytearray(0x1000)
+    for pc in code:
+        covered[pc] = covered[pc + 1] = 1
+
+    # I is only tracked from an Annn to the end of its block
+    stores = []
+    sprites = set()
+    for block in blocks:
+        regI = None
+        for pc in range(block["start"], block["end"], 2):
+            fn, x, y, n = DECODE[(ram[pc] << 8) | ram[pc + 1]]
+            name = fn.__name__
+            written = None
+
+            if name == "op_ld_i":
+                regI = n
+            elif name in ("op_add_i_vx", "op_ld_f_vx"):
+                regI = None
+            elif name == "op_drw" and regI is not None:
+                sprites.update(range(regI, min(regI + n, 0x1000)))
+            elif name == "op_ld_i_vx":
+                written = x + 1
+            elif name == "op_ld_b_vx":
+                written = 3
+
+            if written is not None:
+                if regI is None:
+                    stores.append({"pc": pc, "target": None})
+                elif any(covered[regI:regI + written]):
+                    stores.append({"pc": pc, "target": regI, "size": written})
+
+    # runs of rom bytes never executed
+    data = []
+    for a in range(0x200, rom_end):
+        if covered[a]:
+            continue
+        if data and data[-1][1] == a:
+            data[-1][1] = a + 1
+        else:
+            data.append([a, a + 1])
+
+    return {
+        "rom": cache.rom_hash(rom),
+        "size": len(rom),
+        "blocks": blocks,
+        "calls": sorted(calls),
+        "loops": sorted(loops),
+        "indirect": sorted(indirect),
+        "invalid": sorted(invalid),
+        "data": data,
+        "sprites": sorted(sprites),
+        "self_modifying": [s for s in stores if s["target"] is not None],
+        "unknown_stores": [s["pc"] for s in stores if s["target"] is None],
+    }
+
+
+# the analysis of a rom, from the cache when it was analyzed before
+def load_analysis(rom: bytes, use_cache=True) -> dict:
+    if use_cache:
+        cached = cache.load(rom, "analysis.json")
+        if cached is not None:
+            return json.loads(cached)
+
+    result = analyze(rom)
+    if use_cache:
+        cache.store(rom, "analysis.json", json.dumps(result).encode())
+    return result
+
+
+def listing(rom: bytes, result: dict) -> str:
+    ram = Chip8(rom).ram
+    starts = {b["start"] for b in result["blocks"]}
+    loops = set(result["loops"])
+    calls = set(result["calls"])
+    smc = {s["pc"] for s in result["self_modifying"]}
+    data = {a for lo, hi in result["data"] for a in range(lo, hi)}
+    sprites = set(result["sprites"])
+
+    lines = []
+    a = 0x200
+    while a < 0x200 + len(rom):
+        if a in data:
+            row = []
+            while a in data and len(row) < 8:
+                row.append(ram[a])
+                a += 1
+            kind = "sprite" if a - 1 in sprites else "data"
+            lines.append(f"{a - len(row):03X}  {kind:6} " + " ".join(f"{b:02X}" for b in row))
+            continue
+
+        if a in starts:
+            label = "sub" if a in calls else "loop" if a in loops else "block"
+            lines.append(f"{label}_{a:03X}:")
+
+        op = (ram[a] << 8) | ram[a + 1]
+        note = "  ; writes into code" if a in smc else ""
+        lines.append(f"{a:03X}  {op:04X}   {disassemble(op)}{note}")
+        a += 2
+
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="disassemble a rom and analyze its control flow")
+    parser.add_argument("rom")
+    parser.add_argument("--json", action="store_true", help="print the analysis as json")
+    parser.add_argument("--no-cache", action="store_true", help="ignore and do not update the analysis cache")
+    args = parser.parse_args()
+
+    with open(args.rom, "rb") as f:
+        rom = f.read()
+
+    result = load_analysis(rom, use_cache=not args.no_cache)
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        sys.stdout.write(listing(rom, result) + "\n")
+
+
+
+if __name__ == "__main__":
+    main()
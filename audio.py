@@ -0,0 +1,106 @@
+import os, sys, time
+
+
+# the buzzer is switched on edges only: when Fx18 loads the sound timer and
+# when the timer runs out at the end of a frame. nothing runs per instruction,
+# while the tone plays sample() is called at the end of every frame
+
+# keeps count of the edges, for headless runs
+class NullAudio:
+    def __init__(self):
+        self.playing = False
+        self.starts = 0
+        self.beep_time = 0.0
+        self.started = 0.0
+
+    def buzz(self, on):
+        if on == self.playing:
+            return
+        self.playing = on
+        if on:
+            self.starts += 1
+            self.started = time.perf_counter()
+        else:
+            self.beep_time += time.perf_counter() - self.started
+
+    def sample(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "null", "beeps": self.starts, "beep_seconds": round(self.beep_time, 3)}
+
+    def close(self):
+        self.buzz(False)
+
+
+# plays one square wave buffer computed up front, looped by the mixer for
+# as long as the buzzer is on
+class PygameAudio(NullAudio):
+    def __init__(self, tone=440, volume=0.2, frequency=44100, buffer=512):
+        super().__init__()
+
+        os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+        import pygame as pg
+
+        pg.mixer.init(frequency=frequency, size=-16, channels=1, buffer=buffer)
+        self.mixer = pg.mixer
+        self.frequency, _, channels = pg.mixer.get_init()
+        self.buffer = buffer
+
+        # a whole number of periods, so the loop point does not click
+        period = round(self.frequency / tone)
+        level = int(32767 * volume)
+        wave = b"".join(
+            (level if i < period // 2 else -level).to_bytes(2, sys.byteorder, signed=True) * channels
+            for i in range(period)
+        )
+        self.sound = pg.mixer.Sound(buffer=wave * max(1, self.frequency // 10 // period))
+        self.channel = None
+
+        # frames that ended with the tone on but the mixer not playing it,
+        # e.g. when play() found no free channel
+        self.silent_frames = 0
+        self.sampled_frames = 0
+
+    def buzz(self, on):
+        if on == self.playing:
+            return
+        super().buzz(on)
+        if on:
+            self.channel = self.sound.play(loops=-1)
+        elif self.channel is not None:
+            self.channel.stop()
+
+    def sample(self):
+        self.sampled_frames += 1
+        if self.channel is None or not self.channel.get_busy():
+            self.silent_frames += 1
+
+    # the delay between an edge and the speaker is not observable from
+    # here, only its lower bound of one mixer buffer is reported
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({
+            "backend": "pygame",
+            "frequency": self.frequency,
+            "buffer_latency_ms_estimate": round(self.buffer * 1000 / self.frequency, 1),
+            "sampled_frames": self.sampled_frames,
+            "silent_frames": self.silent_frames,
+        })
+        return stats
+
+    def close(self):
+        super().close()
+        self.mixer.quit()
+
+
+AUDIO = ["pygame", "null"]
+
+def get_audio(name):
+    match name:
+        case "pygame":
+            return PygameAudio()
+        case "null":
+            return NullAudio()
+        case _:
+            raise ValueError(f"unknown audio backend: {name}")
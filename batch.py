@@ -0,0 +1,74 @@
+import argparse, hashlib, json, os, sys, time
+from multiprocessing import Pool
+
+import cache
+from chip8 import Chip8
+
+
+# runs one rom headless for a cycle budget and reports its final state
+def run_rom(job):
+    path, cycles, ipf, jit, seed, use_cache = job
+
+    result = {"rom": path, "seed": seed}
+    try:
+        with open(path, "rb") as f:
+            rom = f.read()
+        cpu = Chip8(rom, jit=jit, ipf=ipf, seed=seed)
+    except (OSError, ValueError) as e:
+        result["error"] = str(e)
+        return result
+
+    if use_cache:
+        cache.load_blocks(rom, cpu)
+
+    start = time.perf_counter()
+    try:
+        while cpu.cycles < cycles:
+            cpu.run_frame()
+    except Exception as e:
+        result["error"] = repr(e)
+    elapsed = time.perf_counter() - start
+
+    if use_cache:
+        cache.store_blocks(rom, cpu)
+
+    result.update({
+        "screen": hashlib.sha1(cpu.screen.tobytes()).hexdigest(),
+        "V": list(cpu.regV),
+        "I": cpu.regI,
+        "PC": cpu.regPC,
+        "SP": cpu.regSP,
+        "stack": cpu.stack[1:cpu.regSP + 1],
+        "delayT": cpu.delayT,
+        "soundT": cpu.soundT,
+        "cycles": cpu.cycles,
+        "executed": cpu.executed,
+        "frames": cpu.frames,
+        "seconds": round(elapsed, 6),
+        "ips": round(cpu.executed / elapsed) if elapsed > 0 else None,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run many roms headless, one json line per rom")
+    parser.add_argument("roms", nargs="+")
+    parser.add_argument("--cycles", type=int, default=100_000, help="instructions to run per rom")
+    parser.add_argument("--ipf", type=int, default=10, help="instructions per 60 Hz frame")
+    parser.add_argument("--jit", action="store_true")
+    parser.add_argument("--cache", action="store_true", help="with --jit, reuse and keep compiled blocks between runs")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the Cxkk random generator of every rom")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args()
+
+    jobs = [(rom, args.cycles, args.ipf, args.jit, args.seed, args.jit and args.cache) for rom in args.roms]
+
+    with Pool(args.jobs) as pool:
+        for result in pool.imap(run_rom, jobs):
+            sys.stdout.write(json.dumps(result) + "\n")
+            sys.stdout.flush()
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import argparse, gc, json, os, platform, subprocess, sys, time
+
+from byte import Byte, Short
+from chip8 import Chip8
+
+
+def assemble(*words):
+    return b"".join(w.to_bytes(2, "big") for w in words)
+
+
+# tiny roms that loop over a single opcode family forever
+MICRO = {
+    "alu": assemble(
+        0x6001, 0x6102,
+        0x8014, 0x8015, 0x8011, 0x8012, 0x8013, 0x8016, 0x801E, 0x8017, 0x8010, 0x7001,
+        0x1204,
+    ),
+    "skip": assemble(
+        0x6005, 0x6105,
+        0x3005, 0x0000, 0x4006, 0x0000, 0x5010, 0x0000, 0x9010, 0x0000,
+        0x1204,
+    ),
+    "jump_call": assemble(
+        0x2206, 0x1200, 0x0000,
+        0x2208, 0x00EE,
+    ),
+    "draw": assemble(
+        0x6000, 0x6100, 0xA000,
+        0xD015, 0x7008, 0x7103,
+        0x1206,
+    ),
+    "mem": assemble(
+        0xA300, 0x6000,
+        0xF355, 0xF365, 0xF333, 0xF01E, 0xF029, 0xA300,
+        0x1204,
+    ),
+    "timer_key": assemble(
+        0x6001,
+        0xF015, 0xF007, 0xF018, 0xE09E, 0x0000, 0xE0A1, 0x0000,
+        0x1202,
+    ),
+}
+
+# real roms, found next to this file wherever it is run from
+HERE = os.path.dirname(os.path.abspath(__file__))
+MACRO = ["pong.rom", "pong2.rom", "tetris.rom", "tictac.rom", "test_opcode.ch8"]
+
+# the jit is warmed up in windows of this many frames, until a window
+# translates no new block or the limit is reached
+WARMUP_FRAMES = 60
+WARMUP_WINDOWS = 50
+
+
+# runs a rom for `cycles` instructions and measures speed and memory churn.
+# cpython only exposes net allocation counts, so churn is reported as the
+# change in allocated blocks plus the number of gen 0 collections it caused
+def measure(rom, cycles, jit, ipf):
+    cpu = Chip8(rom, jit=jit, ipf=ipf)
+
+    # warm up the decode table and the jit cache, so the timed part
+    # measures running blocks rather than compiling them
+    cpu.run_frame()
+    if cpu.blocks is not None:
+        for _ in range(WARMUP_WINDOWS):
+            translated = len(cpu.blocks.blocks)
+            for _ in range(WARMUP_FRAMES):
+                cpu.run_frame()
+            if len(cpu.blocks.blocks) == translated:
+                break
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    collections = gc.get_stats()[0]["collections"]
+    start_cycles = cpu.cycles
+    start_executed = cpu.executed
+
+    start = time.perf_counter()
+    while cpu.cycles - start_cycles < cycles:
+        cpu.run_frame()
+    elapsed = time.perf_counter() - start
+
+    # instructions skipped while idle cost nothing and are not counted
+    count = max(cpu.executed - start_executed, 1)
+    return {
+        "cycles": cpu.cycles - start_cycles,
+        "instructions": count,
+        "seconds": round(elapsed, 6),
+        "ips": round(count / elapsed),
+        "blocks_per_instr": round((sys.getallocatedblocks() - blocks) / count, 6),
+        "gc_per_kinstr": round((gc.get_stats()[0]["collections"] - collections) * 1000 / count, 6),
+    }
+
+
+# the boxed arithmetic from byte.py, for comparison with the native int core
+def measure_byte(ops):
+    x = Byte(0)
+    y = Short(0)
+
+    start = time.perf_counter()
+    for _ in range(ops):
+        x += 1
+        x = x - Byte(3)
+        y = y + x
+    elapsed = time.perf_counter() - start
+
+    return {
+        "instructions": ops * 3,
+        "seconds": round(elapsed, 6),
+        "ips": round(ops * 3 / elapsed),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(cycles, ipf):
+    results = {}
+
+    for name, rom in MICRO.items():
+        for jit in (False, True):
+            results[f"micro/{name}/{'jit' if jit else 'interp'}"] = measure(rom, cycles, jit, ipf)
+
+    for path in MACRO:
+        with open(os.path.join(HERE, path), "rb") as f:
+            rom = f.read()
+        for jit in (False, True):
+            results[f"macro/{path}/{'jit' if jit else 'interp'}"] = measure(rom, cycles, jit, ipf)
+
+    results["byte/arith"] = measure_byte(cycles // 3)
+    return results
+
+
+# prints the speed of every benchmark relative to an older result file
+def compare(results, old, threshold):
+    regressed = False
+    for name, r in results.items():
+        if name not in old:
+            continue
+        ratio = r["ips"] / old[name]["ips"]
+        mark = ""
+        if ratio < 1 - threshold:
+            mark = "  REGRESSION"
+            regressed = True
+        print(f"{name:40} {old[name]['ips']:>12} -> {r['ips']:>12}  {ratio:6.2f}x{mark}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="interpreter throughput benchmarks")
+    parser.add_argument("--cycles", type=int, default=200_000, help="instructions per benchmark")
+    parser.add_argument("--ipf", type=int, default=1000, help="instructions per frame")
+    parser.add_argument("--out", help="write the results as json")
+    parser.add_argument("--compare", help="json results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = run_all(args.cycles, args.ipf)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cycles": args.cycles,
+        "ipf": args.ipf,
+        "results": results,
+    }
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)["results"]
+        if compare(results, old, args.threshold):
+            exit(1)
+    else:
+        for name, r in results.items():
+            print(f"{name:40} {r['ips']:>12} ips")
+
+
+
+if __name__ == "__main__":
+    main()
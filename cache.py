@@ -0,0 +1,79 @@
+import hashlib, os
+from importlib.util import MAGIC_NUMBER
+
+
+# everything derived from a rom is cached under its content hash
+CACHE_DIR = os.environ.get("PYCHIP8_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "pychip8")
+
+# analyses and compiled blocks depend on the core, the jit and the python
+# bytecode format. any change to those starts a new cache directory
+def emulator_version() -> str:
+    h = hashlib.sha1(MAGIC_NUMBER)
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ("chip8.py", "jit.py", "analyze.py"):
+        try:
+            with open(os.path.join(here, name), "rb") as f:
+                h.update(f.read())
+        except OSError:
+            pass
+    return h.hexdigest()[:16]
+
+VERSION = emulator_version()
+
+
+def rom_hash(rom: bytes) -> str:
+    return hashlib.sha1(rom).hexdigest()
+
+def cache_path(name: str) -> str:
+    return os.path.join(CACHE_DIR, VERSION, name)
+
+# cached blocks are run as code, so only files of this user that nobody
+# else can write to are read back
+def trusted(st) -> bool:
+    if not hasattr(os, "getuid"):
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+def private(path, flags):
+    return os.open(path, flags, 0o600)
+
+def load_file(name: str):
+    try:
+        with open(cache_path(name), "rb") as f:
+            if not trusted(os.fstat(f.fileno())):
+                return None
+            return f.read()
+    except OSError:
+        return None
+
+# written to a temporary file first, concurrent readers never see half of it.
+# the directories and files are only accessible to this user
+def store_file(name: str, data: bytes):
+    path = cache_path(name)
+    try:
+        os.makedirs(CACHE_DIR, 0o700, exist_ok=True)
+        os.makedirs(os.path.dirname(path), 0o700, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb", opener=private) as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+def load(rom: bytes, kind: str):
+    return load_file(f"{rom_hash(rom)}.{kind}")
+
+def store(rom: bytes, kind: str, data: bytes):
+    store_file(f"{rom_hash(rom)}.{kind}", data)
+
+
+# compiled jit blocks of a rom, kept from one run to the next
+def load_blocks(rom: bytes, cpu) -> int:
+    data = load(rom, "blocks")
+    if data is None or cpu.blocks is None:
+        return 0
+    return cpu.blocks.load(cpu, data)
+
+def store_blocks(rom: bytes, cpu):
+    if cpu.blocks is not None and cpu.blocks.blocks:
+        store(rom, "blocks", cpu.blocks.dump(cpu.ram))
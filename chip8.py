@@ -0,0 +1,713 @@
+import sys, random, struct, time
+from array import array
+
+from audio import NullAudio
+from jit import BlockCache, MAX_BLOCK
+
+
+FONT = [
+    # 0
+    0xF0,
+    0x90,
+    0x90,
+    0x90,
+    0xF0,
+
+    # 1
+    0x20,
+    0x60,
+    0x20,
+    0x20,
+    0x70,
+
+    # 2
+    0xF0,
+    0x10,
+    0xF0,
+    0x80,
+    0xF0,
+
+    # 3
+    0xF0,
+    0x10,
+    0xF0,
+    0x10,
+    0xF0,
+
+    # 4
+    0x90,
+    0x90,
+    0xF0,
+    0x10,
+    0x10,
+
+    # 5
+    0xF0,
+    0x80,
+    0xF0,
+    0x10,
+    0xF0,
+
+    # 6
+    0xF0,
+    0x80,
+    0xF0,
+    0x90,
+    0xF0,
+
+    # 7
+    0xF0,
+    0x10,
+    0x20,
+    0x40,
+    0x40,
+
+    # 8
+    0xF0,
+    0x90,
+    0xF0,
+    0x90,
+    0xF0,
+
+    # 9
+    0xF0,
+    0x90,
+    0xF0,
+    0x10,
+    0xF0,
+
+    # A
+    0xF0,
+    0x90,
+    0xF0,
+    0x90,
+    0x90,
+
+    # B
+    0xE0,
+    0x90,
+    0xE0,
+    0x90,
+    0xE0,
+
+    # C
+    0xF0,
+    0x80,
+    0x80,
+    0x80,
+    0xF0,
+
+    # D
+    0xE0,
+    0x90,
+    0x90,
+    0x90,
+    0xE0,
+
+    # E
+    0xF0,
+    0x80,
+    0xF0,
+    0x80,
+    0xF0,
+
+    # F
+    0xF0,
+    0x80,
+    0xF0,
+    0x80,
+    0x80,
+]
+
+BLANK = array("Q", [0] * 32)
+ALL_ROWS = (1 << 32) - 1
+
+# snapshot layout: PC, I, SP, delay, sound, cycles, frames, V, stack,
+# ram, screen, then the mersenne twister state and the cached gauss value
+STATE = struct.Struct("<4sHHHBBQQ16s32s4096s256s625I?d")
+STATE_MAGIC = b"C8S1"
+
+
+class Chip8:
+    def __init__(self, rom, debug=False, jit=False, ipf=10, seed=None):
+        if len(rom) > 0x1000 - 0x200:
+            raise ValueError(f"rom too large: {len(rom)} bytes")
+
+        # 4 KiB of ram, font at address 0, rom at 0x200
+        self.ram = bytearray(0x1000)
+        self.ram[:len(FONT)] = bytes(FONT)
+        self.ram[0x200:0x200 + len(rom)] = rom
+
+        # the 16 "V" registers
+        self.regV = bytearray(16)
+
+        # the 16 bit "I" register
+        self.regI = 0
+
+        # program counter
+        self.regPC = 0x200
+
+        # call stack
+        self.stack = [0] * 16
+
+        # stack pointer
+        self.regSP = 0
+
+        self.delayT = 0
+        self.soundT = 0
+
+        # switched on and off on sound timer edges, see audio.py
+        self.audio = NullAudio()
+
+        # every machine has its own random generator for Cxkk
+        self.rng = random.Random(seed)
+
+        # instructions per 60 Hz frame
+        self.ipf = ipf
+
+        # emulated instructions and frames. cycles includes the rest of
+        # a frame skipped while idle, executed only what actually ran
+        self.cycles = 0
+        self.frames = 0
+        self.executed = 0
+
+        # pressed keys, bit n set while key n is held. set by the frontend
+        self.keys = 0
+
+        # one bit per screen row that changed since the
+        # frontend last presented it, cleared by the frontend
+        self.dirty = ALL_ROWS
+
+        # 64x32 display, one 64 bit row per line,
+        # the most significant bit is the leftmost pixel
+        self.screen = array("Q", BLANK)
+
+        self.debug_on = debug
+
+        # set by an instruction that can't make progress before the next
+        # timer tick, run_frame() then skips the rest of the frame
+        self.idle = False
+
+        # Fx0A is waiting for a key
+        self.waiting = False
+
+        # (jump address, target) -> whether the jump closes a delay timer polling loop
+        self.timer_loops = {}
+
+        # translated basic blocks, see jit.py
+        self.blocks = BlockCache(DECODE) if jit else None
+
+
+    # the whole machine state as one binary blob
+    def snapshot(self) -> bytes:
+        _, mt, gauss = self.rng.getstate()
+        return STATE.pack(
+            STATE_MAGIC, self.regPC, self.regI, self.regSP, self.delayT, self.soundT,
+            self.cycles, self.frames, self.regV, struct.pack("<16H", *self.stack),
+            self.ram, self.screen.tobytes(), *mt, gauss is not None, gauss or 0.0,
+        )
+
+    def restore(self, blob):
+        state = STATE.unpack(blob)
+        if state[0] != STATE_MAGIC:
+            raise ValueError("not a Chip8 snapshot")
+
+        (_, self.regPC, self.regI, self.regSP, self.delayT, self.soundT,
+            self.cycles, self.frames, regV, stack, ram, screen) = state[:12]
+        has_gauss, gauss = state[-2:]
+
+        # copied into the existing buffers, nothing is allocated per byte
+        self.regV[:] = regV
+        self.stack[:] = struct.unpack("<16H", stack)
+        self.ram[:] = ram
+        memoryview(self.screen).cast("B")[:] = screen
+        self.rng.setstate((3, state[12:-2], gauss if has_gauss else None))
+
+        self.dirty = ALL_ROWS
+        self.audio.buzz(self.soundT > 0)
+
+        # a restored machine is not waiting for a key, if it still
+        # should be its Fx0A sets the flags again
+        self.idle = self.waiting = False
+        self.timer_loops.clear()
+        if self.blocks is not None:
+            self.blocks.invalidate(0, 0x1000)
+
+
+    def fetch(self, addr) -> int:
+        return (self.ram[addr] << 8) | self.ram[addr + 1]
+
+    # run the next instruction, or the next block of at most `budget`
+    # instructions in jit mode. returns the number of executed instructions
+    def step(self, budget=MAX_BLOCK) -> int:
+        if self.blocks is not None:
+            return self.blocks.run(self, budget)
+        self.execute(self.fetch(self.regPC))
+        return 1
+
+    def execute(self, instr: int):
+        fn, x, y, n = DECODE[instr]
+        fn(self, x, y, n)
+
+    # 00E0 clear display
+    def op_cls(self, x, y, n):
+        self.clear_display()
+        self.regPC += 2
+
+    # 00EE return from subroutine
+    def op_ret(self, x, y, n):
+        if self.regSP == 0:
+            return
+        self.regPC = self.stack[self.regSP] + 2
+        self.regSP -= 1
+
+    # 0nnn jump to address (ignored)
+    def op_sys(self, x, y, nnn):
+        self.regPC += 2
+
+    # 1nnn jump to address
+    def op_jp(self, x, y, nnn):
+        pc = self.regPC
+        if pc - 8 <= nnn <= pc and (nnn == pc or self.timer_loop(pc, nnn)):
+            self.idle = True
+        self.regPC = nnn
+
+    # whether jumping from pc back to target loops over nothing but reading
+    # the delay timer and skips on that register, e.g. F007 3000 1200.
+    # such a loop can't exit before the timer changes at the end of the frame
+    def timer_loop(self, pc, target) -> bool:
+        loop = self.timer_loops.get((pc, target))
+        if loop is None:
+            loop = False
+            if pc - 8 <= target < pc:
+                op = self.fetch(target)
+                reg = (op >> 8) & 0xF
+                loop = op & 0xF0FF == 0xF007 and all(
+                    self.fetch(a) >> 12 in (0x3, 0x4) and (self.fetch(a) >> 8) & 0xF == reg
+                    for a in range(target + 2, pc, 2)
+                )
+            self.timer_loops[(pc, target)] = loop
+        return loop
+
+    # 2nnn call adress
+    def op_call(self, x, y, nnn):
+        self.regSP = (self.regSP + 1) & 0xF
+        self.stack[self.regSP] = self.regPC
+        self.regPC = nnn
+
+    # 3xkk skip instruction if Vx == kk
+    def op_se_vx_kk(self, x, y, kk):
+        self.regPC += 4 if self.regV[x] == kk else 2
+
+    # 4xkk skip instruction if Vx != kk
+    def op_sne_vx_kk(self, x, y, kk):
+        self.regPC += 4 if self.regV[x] != kk else 2
+
+    # 5xy0 skip instruction if Vx == Vy
+    def op_se_vx_vy(self, x, y, n):
+        self.regPC += 4 if self.regV[x] == self.regV[y] else 2
+
+    # 6xkk set Vx = kk
+    def op_ld_vx_kk(self, x, y, kk):
+        self.regV[x] = kk
+        self.regPC += 2
+
+    # 7xkk add kk to Vx (no carry)
+    def op_add_vx_kk(self, x, y, kk):
+        self.regV[x] = (self.regV[x] + kk) & 0xFF
+        self.regPC += 2
+
+    # 8xy? operators
+    def op_ld_vx_vy(self, x, y, n):
+        self.regV[x] = self.regV[y]
+        self.regPC += 2
+
+    def op_or(self, x, y, n):
+        self.regV[x] |= self.regV[y]
+        self.regPC += 2
+
+    def op_and(self, x, y, n):
+        self.regV[x] &= self.regV[y]
+        self.regPC += 2
+
+    def op_xor(self, x, y, n):
+        self.regV[x] ^= self.regV[y]
+        self.regPC += 2
+
+    # VF = carry
+    def op_add_vx_vy(self, x, y, n):
+        r = self.regV[x] + self.regV[y]
+        self.regV[x] = r & 0xFF
+        self.regV[0xF] = r >> 8
+        self.regPC += 2
+
+    # VF = not borrow
+    def op_sub(self, x, y, n):
+        vx, vy = self.regV[x], self.regV[y]
+        self.regV[x] = (vx - vy) & 0xFF
+        self.regV[0xF] = vx >= vy
+        self.regPC += 2
+
+    def op_shr(self, x, y, n):
+        vx = self.regV[x]
+        self.regV[x] = vx >> 1
+        self.regV[0xF] = vx & 1
+        self.regPC += 2
+
+    def op_subn(self, x, y, n):
+        vx, vy = self.regV[x], self.regV[y]
+        self.regV[x] = (vy - vx) & 0xFF
+        self.regV[0xF] = vy >= vx
+        self.regPC += 2
+
+    def op_shl(self, x, y, n):
+        vx = self.regV[x]
+        self.regV[x] = (vx << 1) & 0xFF
+        self.regV[0xF] = vx >> 7
+        self.regPC += 2
+
+    # 9xy0 skip instrction if Vx != Vy
+    def op_sne_vx_vy(self, x, y, n):
+        self.regPC += 4 if self.regV[x] != self.regV[y] else 2
+
+    # Annn set reg I to nnn
+    def op_ld_i(self, x, y, nnn):
+        self.regI = nnn
+        self.regPC += 2
+
+    # Bnnn jmp to nnn + reg V0
+    def op_jp_v0(self, x, y, nnn):
+        self.regPC = (nnn + self.regV[0]) & 0xFFF
+
+    # Cxkk Vx = random byte & kk
+    def op_rnd(self, x, y, kk):
+        self.regV[x] = self.rng.randint(0, 255) & kk
+        self.regPC += 2
+
+    # Dxyn draw sprite
+    def op_drw(self, x, y, n):
+        self.draw_sprite(self.ram[self.regI:self.regI+n], self.regV[x], self.regV[y])
+        self.regPC += 2
+
+    # Ex9E skip if key Vx is pressed
+    def op_skp(self, x, y, n):
+        self.regPC += 4 if (self.keys >> (self.regV[x] & 0xF)) & 1 else 2
+
+    # ExA1 skip if key Vx is not pressed
+    def op_sknp(self, x, y, n):
+        self.regPC += 2 if (self.keys >> (self.regV[x] & 0xF)) & 1 else 4
+
+    # Fx07 Vx = DT
+    def op_ld_vx_dt(self, x, y, n):
+        self.regV[x] = self.delayT
+        self.regPC += 2
+
+    # Fx0A wait for key, store the lowest pressed one in Vx
+    def op_ld_vx_k(self, x, y, n):
+        keys = self.keys
+
+        if keys:
+            self.regV[x] = (keys & -keys).bit_length() - 1
+            self.regPC += 2
+            self.waiting = False
+        else:
+            self.idle = self.waiting = True
+
+    # Fx15 Vx = Delay timer     Ich hab keine ahnung ob das hier sinn macht
+    #                           mein ausbilder zwingt mich übrigens dazu meine docs, kommentare und generell alles auf deutsch zu schreiben
+    def op_ld_dt_vx(self, x, y, n):
+        self.delayT = self.regV[x]
+        self.regPC += 2
+
+    # Fx18 soundT = Vx
+    def op_ld_st_vx(self, x, y, n):
+        self.soundT = self.regV[x]
+        self.audio.buzz(self.soundT > 0)
+        self.regPC += 2
+
+    # Fx1E I += Vx
+    def op_add_i_vx(self, x, y, n):
+        self.regI = (self.regI + self.regV[x]) & 0xFFFF
+        self.regPC += 2
+
+    # Fx29 load glyph from font data corresponding to Vx
+    def op_ld_f_vx(self, x, y, n):
+        # each glyph is 5 bytes,
+        # the font data is stored at address 0
+        # Vx = wievieltes sprite
+        self.regI = (self.regV[x] & 0xF) * 5
+        self.regPC += 2
+
+    # Fx33 store decimal representation of Vx at I, I+1 and I+2.
+    # like Fx55 and Fx65 it stops at the end of ram, slice assignments
+    # must never change the length of ram or of the registers
+    def op_ld_b_vx(self, x, y, n):
+        vx = self.regV[x]
+        I = self.regI
+        k = max(0, min(3, 0x1000 - I))
+        self.ram[I:I+k] = bytes((vx // 100, vx // 10 % 10, vx % 10))[:k]
+        self.timer_loops.clear()
+        self.regPC += 2
+
+    # Fx55 store V0 - Vx in memory
+    def op_ld_i_vx(self, x, y, n):
+        I = self.regI
+        k = max(0, min(x + 1, 0x1000 - I))
+        self.ram[I:I+k] = self.regV[:k]
+        self.timer_loops.clear()
+        self.regPC += 2
+
+    # Fx65 load V0 - Vx from memory
+    def op_ld_vx_i(self, x, y, n):
+        I = self.regI
+        k = max(0, min(x + 1, 0x1000 - I))
+        self.regV[:k] = self.ram[I:I+k]
+        self.regPC += 2
+
+    def op_unimplemented(self, x, y, n):
+        raise Exception("unimplemented: ", hex(self.fetch(self.regPC))[2:])
+
+
+    # one 60 Hz frame: a batch of `ipf` instructions, then the timers tick.
+    # once the machine idles the rest of the batch is counted but not run
+    def run_frame(self) -> int:
+        count = 0
+
+        if self.debug_on:
+            while count < self.ipf and not self.idle:
+                pc = self.regPC
+                count += self.step(self.ipf - count)
+                self.debug(self.fetch(pc))
+        else:
+            while count < self.ipf and not self.idle:
+                count += self.step(self.ipf - count)
+
+        return self.end_frame(count)
+
+    # the end of a frame that ran `count` instructions
+    def end_frame(self, count) -> int:
+        self.executed += count
+        if self.idle:
+            self.idle = False
+            count = max(count, self.ipf)
+
+        if self.delayT > 0:
+            self.delayT -= 1
+        if self.soundT > 0:
+            self.soundT -= 1
+            if not self.soundT:
+                self.audio.buzz(False)
+            else:
+                self.audio.sample()
+
+        self.cycles += count
+        self.frames += 1
+        return count
+
+
+    # runs until the frontend asks to quit, or after `cycles` instructions.
+    # frames are paced to 60 Hz and the rest of each frame is slept away,
+    # in turbo mode frames run back to back and are only polled and
+    # presented as often as a real 60 Hz display would show them.
+    # with a `rewind` buffer every frame is recorded, and frames are
+    # played backwards while the frontend's rewind key is held
+    def run(self, frontend, cycles=None, turbo=False, rewind=None):
+        frame = 1 / 60
+        deadline = time.perf_counter()
+
+        if self.debug_on:
+            self.debug()
+
+        if rewind is not None:
+            rewind.record(self)
+
+        while cycles is None or self.cycles < cycles:
+            if turbo and time.perf_counter() < deadline:
+                self.run_frame()
+                if rewind is not None:
+                    rewind.record(self)
+                continue
+
+            # nothing can happen until a key is pressed
+            if self.waiting and not turbo and self.delayT == 0 and self.soundT == 0:
+                frontend.wait()
+
+            if not frontend.poll(self):
+                break
+
+            if rewind is not None and frontend.rewinding:
+                rewind.step_back(self)
+            else:
+                self.run_frame()
+                if rewind is not None:
+                    rewind.record(self)
+
+            frontend.present(self)
+
+            deadline += frame
+            now = time.perf_counter()
+            if deadline < now - frame:
+                # fell too far behind, don't try to catch up
+                deadline = now
+            elif not turbo and deadline > now:
+                time.sleep(deadline - now)
+
+        frontend.close(self)
+
+
+    # every sprite row is xor-ed into the packed screen row in one go,
+    # the start position wraps around and the sprite is clipped at the edges
+    def draw_sprite(self, sprite, x, y):
+        x &= 63
+        y &= 31
+        screen = self.screen
+        collision = 0
+
+        top = y
+        for byte in sprite[:32 - y]:
+            bits = (byte << 56) >> x
+            row = screen[y]
+            collision |= row & bits
+            screen[y] = row ^ bits
+            y += 1
+
+        self.regV[0xF] = collision != 0
+        self.dirty |= (1 << y) - (1 << top)
+
+
+    def pixel(self, x, y) -> int:
+        return (self.screen[y] >> (63 - x)) & 1
+
+
+    def clear_display(self):
+        self.screen[:] = BLANK
+        self.dirty = ALL_ROWS
+
+
+    last_instr = None
+    inst_count = 0
+
+    def debug(self, instr: int | None = None):
+        lines = 7
+        if not self.last_instr:
+            sys.stdout.write("\n"*(lines+1))
+        sys.stdout.write("\033[F"*lines)
+
+        if instr is not None:
+            self.inst_count += 1
+
+        def black(s: str):
+            return "\x1b[30m" + s + "\x1b[0m"
+
+        # instructions
+        sys.stdout.write(black("count: ") + str(self.inst_count) + "\n")
+        sys.stdout.write(black(self.last_instr if self.last_instr else "    ") + " ")
+        sys.stdout.write("\x1b[30;42m" + ("{:04X}".format(instr) if instr is not None else "....") + "\x1b[0m ")
+        sys.stdout.write(black("{:04X}".format(self.fetch(self.regPC))))
+        sys.stdout.write("\n")
+
+        # registers
+        sys.stdout.write(black("PC: ") + "0x{:04X}".format(self.regPC) + black(" I: ") + "0x{:04X}".format(self.regI) + black(" SP: ") + "{:02X}".format(self.regSP))
+        sys.stdout.write("\n\n")
+
+        for i, vreg in enumerate(self.regV):
+            sys.stdout.write(black("V" + "{:01X}".format(i) + ":") + " " + "{:02X}".format(vreg) + " ")
+            if i == 7:
+                sys.stdout.write("\n")
+        sys.stdout.write("\n\n")
+
+        sys.stdout.write(black("stack: "))
+        if self.regSP == 0:
+            sys.stdout.write("empty                                     ")
+        for i in range(self.regSP):
+            sys.stdout.write("{:04X}".format(self.stack[i]) + " ")
+
+
+        sys.stdout.flush()
+
+        self.last_instr = "{:04X}".format(instr) if instr is not None else "...."
+        #breakpoint()
+
+
+
+
+# operands passed to every handler: x, y and the immediate
+# (nnn, kk or n depending on the instruction)
+ALU_OPS = {
+    0x0: Chip8.op_ld_vx_vy,
+    0x1: Chip8.op_or,
+    0x2: Chip8.op_and,
+    0x3: Chip8.op_xor,
+    0x4: Chip8.op_add_vx_vy,
+    0x5: Chip8.op_sub,
+    0x6: Chip8.op_shr,
+    0x7: Chip8.op_subn,
+    0xE: Chip8.op_shl,
+}
+
+E_OPS = {
+    0x9E: Chip8.op_skp,
+    0xA1: Chip8.op_sknp,
+}
+
+F_OPS = {
+    0x07: Chip8.op_ld_vx_dt,
+    0x0A: Chip8.op_ld_vx_k,
+    0x15: Chip8.op_ld_dt_vx,
+    0x18: Chip8.op_ld_st_vx,
+    0x1E: Chip8.op_add_i_vx,
+    0x29: Chip8.op_ld_f_vx,
+    0x33: Chip8.op_ld_b_vx,
+    0x55: Chip8.op_ld_i_vx,
+    0x65: Chip8.op_ld_vx_i,
+}
+
+def decode(op: int):
+    x = (op & 0x0F00) >> 8
+    y = (op & 0x00F0) >> 4
+    n = op & 0x000F
+    kk = op & 0x00FF
+    nnn = op & 0x0FFF
+
+    match op >> 12:
+        case 0x0:
+            if op == 0x00E0:
+                return (Chip8.op_cls, x, y, n)
+            if op == 0x00EE:
+                return (Chip8.op_ret, x, y, n)
+            return (Chip8.op_sys, x, y, nnn)
+        case 0x1:
+            return (Chip8.op_jp, x, y, nnn)
+        case 0x2:
+            return (Chip8.op_call, x, y, nnn)
+        case 0x3:
+            return (Chip8.op_se_vx_kk, x, y, kk)
+        case 0x4:
+            return (Chip8.op_sne_vx_kk, x, y, kk)
+        case 0x5:
+            return (Chip8.op_se_vx_vy, x, y, n)
+        case 0x6:
+            return (Chip8.op_ld_vx_kk, x, y, kk)
+        case 0x7:
+            return (Chip8.op_add_vx_kk, x, y, kk)
+        case 0x8:
+            # unknown operators fall through to the next instruction
+            return (ALU_OPS.get(n, Chip8.op_sys), x, y, n)
+        case 0x9:
+            return (Chip8.op_sne_vx_vy, x, y, n)
+        case 0xA:
+            return (Chip8.op_ld_i, x, y, nnn)
+        case 0xB:
+            return (Chip8.op_jp_v0, x, y, nnn)
+        case 0xC:
+            return (Chip8.op_rnd, x, y, kk)
+        case 0xD:
+            return (Chip8.op_drw, x, y, n)
+        case 0xE:
+            return (E_OPS.get(kk, Chip8.op_unimplemented), x, y, kk)
+        case 0xF:
+            return (F_OPS.get(kk, Chip8.op_unimplemented), x, y, kk)
+
+# every possible opcode decoded once up front,
+# so execute() is a single lookup per instruction
+DECODE = [decode(op) for op in range(0x10000)]
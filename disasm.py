@@ -0,0 +1,53 @@
+from chip8 import DECODE
+
+
+# cowgod style mnemonics, keyed by handler name without the "op_" prefix
+MNEMONICS = {
+    "cls": "CLS",
+    "ret": "RET",
+    "sys": "SYS {n:03X}",
+    "jp": "JP {n:03X}",
+    "call": "CALL {n:03X}",
+    "se_vx_kk": "SE V{x:X}, {n:02X}",
+    "sne_vx_kk": "SNE V{x:X}, {n:02X}",
+    "se_vx_vy": "SE V{x:X}, V{y:X}",
+    "ld_vx_kk": "LD V{x:X}, {n:02X}",
+    "add_vx_kk": "ADD V{x:X}, {n:02X}",
+    "ld_vx_vy": "LD V{x:X}, V{y:X}",
+    "or": "OR V{x:X}, V{y:X}",
+    "and": "AND V{x:X}, V{y:X}",
+    "xor": "XOR V{x:X}, V{y:X}",
+    "add_vx_vy": "ADD V{x:X}, V{y:X}",
+    "sub": "SUB V{x:X}, V{y:X}",
+    "shr": "SHR V{x:X}",
+    "subn": "SUBN V{x:X}, V{y:X}",
+    "shl": "SHL V{x:X}",
+    "sne_vx_vy": "SNE V{x:X}, V{y:X}",
+    "ld_i": "LD I, {n:03X}",
+    "jp_v0": "JP V0, {n:03X}",
+    "rnd": "RND V{x:X}, {n:02X}",
+    "drw": "DRW V{x:X}, V{y:X}, {n:X}",
+    "skp": "SKP V{x:X}",
+    "sknp": "SKNP V{x:X}",
+    "ld_vx_dt": "LD V{x:X}, DT",
+    "ld_vx_k": "LD V{x:X}, K",
+    "ld_dt_vx": "LD DT, V{x:X}",
+    "ld_st_vx": "LD ST, V{x:X}",
+    "add_i_vx": "ADD I, V{x:X}",
+    "ld_f_vx": "LD F, V{x:X}",
+    "ld_b_vx": "LD B, V{x:X}",
+    "ld_i_vx": "LD [I], V{x:X}",
+    "ld_vx_i": "LD V{x:X}, [I]",
+    "unimplemented": "DW {op:04X}",
+}
+
+
+def disassemble(op: int) -> str:
+    fn, x, y, n = DECODE[op]
+    name = fn.__name__[3:]
+
+    # unknown 8xy? operators are decoded as a plain skip to the next instruction
+    if name == "sys" and op >> 12:
+        name = "unimplemented"
+
+    return MNEMONICS[name].format(x=x, y=y, n=n, op=op)
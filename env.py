@@ -0,0 +1,58 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from chip8 import Chip8
+
+
+# programmatic access to the core for training loops, no window needed.
+# observations are views of the machine's own framebuffer, not copies:
+# they change in place on the next step, copy them to keep a frame
+class Env:
+    def __init__(self, ipf=10, jit=False, max_frames=None):
+        self.ipf = ipf
+        self.jit = jit
+        self.max_frames = max_frames
+        self.cpu = None
+        self.view = None
+        self.error = None
+
+    def reset(self, rom, seed=None):
+        self.cpu = Chip8(rom, jit=self.jit, ipf=self.ipf, seed=seed)
+        self.error = None
+
+        # the screen array is only ever written in place, so one view
+        # stays valid for the lifetime of the machine
+        if np is not None:
+            self.view = np.frombuffer(self.cpu.screen, np.uint64)
+        else:
+            self.view = memoryview(self.cpu.screen)
+        return self.view
+
+    # runs `frames` frames with `keys` held, returns (observation, done).
+    # done is set once the machine raised or max_frames is reached
+    def step(self, keys=0, frames=1):
+        cpu = self.cpu
+        cpu.keys = keys
+
+        try:
+            for _ in range(frames):
+                if self.done():
+                    break
+                cpu.run_frame()
+        except Exception as e:
+            self.error = e
+
+        return self.view, self.done()
+
+    def done(self) -> bool:
+        return self.error is not None or (self.max_frames is not None and self.cpu.frames >= self.max_frames)
+
+    # the 32 screen rows as 64 bit ints, bit 63 is the leftmost pixel
+    def observation(self):
+        return self.view
+
+    # a 32x64 array of 0/1 pixels, this one is a copy
+    def pixels(self):
+        return np.unpackbits(self.view.astype(">u8").view(np.uint8)).reshape(32, 64)
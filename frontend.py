@@ -0,0 +1,79 @@
+import sys, time
+
+
+# runs without any output, for headless jobs
+class NullFrontend:
+    rewinding = False
+
+    def poll(self, cpu) -> bool:
+        return True
+
+    def wait(self):
+        pass
+
+    def present(self, cpu):
+        cpu.dirty = 0
+
+    def close(self, cpu):
+        pass
+
+
+# 32 screen rows, each packed into 64 bits, as half block characters
+# with two pixel rows per line
+def draw(rows) -> str:
+    lines = []
+    for y in range(0, 32, 2):
+        line = ""
+        for x in range(63, -1, -1):
+            top = (rows[y] >> x) & 1
+            bottom = (rows[y + 1] >> x) & 1
+            line += "█" if top and bottom else "▀" if top else "▄" if bottom else " "
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# draws the screen in the terminal
+class TerminalFrontend:
+    rewinding = False
+
+    def __init__(self, fps=30):
+        self.interval = 1 / fps
+        self.last = 0
+        sys.stdout.write("\x1b[2J")
+
+    def poll(self, cpu) -> bool:
+        return True
+
+    def wait(self):
+        pass
+
+    def present(self, cpu):
+        now = time.perf_counter()
+        if not cpu.dirty or now - self.last < self.interval:
+            return
+        self.last = now
+
+        sys.stdout.write("\x1b[H" + draw(cpu.screen) + "\n")
+        sys.stdout.flush()
+        cpu.dirty = 0
+
+    def close(self, cpu):
+        # always show the final frame
+        self.last = 0
+        self.present(cpu)
+
+
+FRONTENDS = ["pygame", "terminal", "null"]
+
+# pygame is only imported when its frontend is actually used
+def get_frontend(name, scale=10, keymap="hex"):
+    match name:
+        case "pygame":
+            from pgfrontend import PygameFrontend
+            return PygameFrontend(scale, keymap)
+        case "terminal":
+            return TerminalFrontend()
+        case "null":
+            return NullFrontend()
+        case _:
+            raise ValueError(f"unknown frontend: {name}")
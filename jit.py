@@ -0,0 +1,187 @@
+# translates straight-line runs of chip8 code into python functions.
+# every block is generated as source once, compiled and cached by its
+# start address, so decoding and dispatch is paid once per block
+# instead of once per instruction.
+
+import marshal
+from types import FunctionType
+
+MAX_BLOCK = 64
+
+# bytes before a block that its translation may have looked at,
+# see Chip8.timer_loop
+LOOKBEHIND = 8
+
+# instructions that are inlined into the block body
+INLINE = {
+    "op_ld_vx_kk": "V[{x}] = {n}",
+    "op_add_vx_kk": "V[{x}] = (V[{x}] + {n}) & 0xFF",
+    "op_ld_vx_vy": "V[{x}] = V[{y}]",
+    "op_or": "V[{x}] |= V[{y}]",
+    "op_and": "V[{x}] &= V[{y}]",
+    "op_xor": "V[{x}] ^= V[{y}]",
+    "op_add_vx_vy": "r = V[{x}] + V[{y}]; V[{x}] = r & 0xFF; V[15] = r >> 8",
+    "op_sub": "vx = V[{x}]; vy = V[{y}]; V[{x}] = (vx - vy) & 0xFF; V[15] = vx >= vy",
+    "op_shr": "vx = V[{x}]; V[{x}] = vx >> 1; V[15] = vx & 1",
+    "op_subn": "vx = V[{x}]; vy = V[{y}]; V[{x}] = (vy - vx) & 0xFF; V[15] = vy >= vx",
+    "op_shl": "vx = V[{x}]; V[{x}] = (vx << 1) & 0xFF; V[15] = vx >> 7",
+    "op_ld_i": "cpu.regI = {n}",
+    "op_add_i_vx": "cpu.regI = (cpu.regI + V[{x}]) & 0xFFFF",
+    "op_ld_f_vx": "cpu.regI = (V[{x}] & 0xF) * 5",
+    "op_ld_vx_dt": "V[{x}] = cpu.delayT",
+    "op_ld_dt_vx": "cpu.delayT = V[{x}]",
+    "op_ld_vx_i": "I = cpu.regI; k = max(0, min({x1}, 0x1000 - I)); V[:k] = ram[I:I + k]",
+}
+
+# writes to ram, the block ends after them since they may
+# have overwritten code that follows
+STORES = {
+    "op_ld_i_vx": "I = cpu.regI; k = max(0, min({x1}, 0x1000 - I)); ram[I:I + k] = V[:k]; invalidate(I, I + k); cpu.timer_loops.clear()",
+    "op_ld_b_vx": "I = cpu.regI; k = max(0, min(3, 0x1000 - I)); vx = V[{x}]; ram[I:I + k] = bytes((vx // 100, vx // 10 % 10, vx % 10))[:k]; invalidate(I, I + k); cpu.timer_loops.clear()",
+}
+
+# control flow, always the last instruction of a block
+BRANCHES = {
+    "op_jp": "cpu.regPC = {n}",
+    "op_se_vx_kk": "cpu.regPC = {pc4} if V[{x}] == {n} else {pc2}",
+    "op_sne_vx_kk": "cpu.regPC = {pc4} if V[{x}] != {n} else {pc2}",
+    "op_se_vx_vy": "cpu.regPC = {pc4} if V[{x}] == V[{y}] else {pc2}",
+    "op_sne_vx_vy": "cpu.regPC = {pc4} if V[{x}] != V[{y}] else {pc2}",
+    "op_skp": "cpu.regPC = {pc4} if (cpu.keys >> (V[{x}] & 0xF)) & 1 else {pc2}",
+    "op_sknp": "cpu.regPC = {pc2} if (cpu.keys >> (V[{x}] & 0xF)) & 1 else {pc4}",
+}
+
+# handled by calling the interpreter, ending the block
+EXITS = {
+    "op_call",
+    "op_ret",
+    "op_jp_v0",
+    "op_ld_vx_k",
+    "op_unimplemented",
+}
+
+
+class BlockCache:
+    def __init__(self, decode):
+        self.decode = decode
+        self.blocks = {}
+
+        # how many cached blocks cover each address
+        self.covered = bytearray(0x1000)
+
+        self.namespace = {"invalidate": self.invalidate}
+        for fn, _, _, _ in decode:
+            self.namespace.setdefault(fn.__name__, fn)
+        self.stores = {self.namespace[name] for name in STORES}
+
+
+    # runs the block at pc. a block longer than the `budget` left in the
+    # frame is not started, its first instruction runs alone instead, so
+    # frames end after the same instructions as in the interpreter
+    def run(self, cpu, budget=MAX_BLOCK) -> int:
+        pc = cpu.regPC
+        block = self.blocks.get(pc)
+        if block is None:
+            block = self.translate(cpu, pc)
+        if block[3] <= budget:
+            return block[0](cpu)
+
+        fn, x, y, n = self.decode[cpu.fetch(pc)]
+        I = cpu.regI
+        fn(cpu, x, y, n)
+        if fn in self.stores:
+            self.invalidate(I, min(I + 16, 0x1000))
+        return 1
+
+    # translates the blocks at `starts` ahead of time, e.g. the
+    # basic blocks found by analyze.py
+    def precompile(self, cpu, starts):
+        for start in starts:
+            if start not in self.blocks and start < 0xFFF:
+                self.translate(cpu, start)
+
+
+    def translate(self, cpu, start):
+        ram = cpu.ram
+        if start >= 0xFFF:
+            raise IndexError(f"pc out of range: {start:#x}")
+
+        lines = []
+        pc = start
+
+        while pc < 0xFFF and (pc - start) // 2 < MAX_BLOCK:
+            fn, x, y, n = self.decode[(ram[pc] << 8) | ram[pc + 1]]
+            name = fn.__name__
+            fmt = {"x": x, "y": y, "n": n, "x1": x + 1, "pc2": pc + 2, "pc4": pc + 4}
+            pc += 2
+
+            if name in INLINE:
+                lines.append(INLINE[name].format(**fmt))
+            elif name in STORES:
+                lines.append(STORES[name].format(**fmt))
+                lines.append(f"cpu.regPC = {pc}")
+                break
+            elif name in BRANCHES:
+                if name == "op_jp" and (n == pc - 2 or cpu.timer_loop(pc - 2, n)):
+                    lines.append("cpu.idle = True")
+                lines.append(BRANCHES[name].format(**fmt))
+                break
+            else:
+                lines.append(f"cpu.regPC = {pc - 2}; {name}(cpu, {x}, {y}, {n})")
+                if name in EXITS:
+                    break
+        else:
+            lines.append(f"cpu.regPC = {pc}")
+
+        count = (pc - start) // 2
+        body = "\n".join("    " + l for l in lines)
+        src = f"def block(cpu):\n    V = cpu.regV; ram = cpu.ram\n{body}\n    return {count}\n"
+
+        ns = dict(self.namespace)
+        exec(compile(src, f"<block {start:03X}>", "exec"), ns)
+        return self.install(ns["block"], start, pc)
+
+    # a block depends on its own code and on the LOOKBEHIND bytes before it.
+    # cached as the function, its range and its number of instructions
+    def install(self, fn, start, end):
+        block = (fn, start, end, (end - start) // 2)
+        self.blocks[start] = block
+        for a in range(max(start - LOOKBEHIND, 0), end):
+            self.covered[a] += 1
+        return block
+
+
+    # the cached blocks as bytes, each with the code it was translated from
+    def dump(self, ram) -> bytes:
+        return marshal.dumps([
+            (start, end, bytes(ram[max(start - LOOKBEHIND, 0):end]), fn.__code__)
+            for fn, start, end, _ in self.blocks.values()
+        ])
+
+    # installs dumped blocks whose code is still the same in cpu.ram,
+    # returns how many were installed
+    def load(self, cpu, data) -> int:
+        try:
+            entries = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            return 0
+
+        count = 0
+        for start, end, code, fn in entries:
+            if start not in self.blocks and cpu.ram[max(start - LOOKBEHIND, 0):end] == code:
+                self.install(FunctionType(fn, self.namespace), start, end)
+                count += 1
+        return count
+
+
+    # drop every block that depends on the written range lo..hi
+    def invalidate(self, lo, hi):
+        if not any(self.covered[lo:hi]):
+            return
+
+        for start, block in list(self.blocks.items()):
+            _, _, end, _ = block
+            if start - LOOKBEHIND < hi and lo < end:
+                del self.blocks[start]
+                for a in range(max(start - LOOKBEHIND, 0), end):
+                    self.covered[a] -= 1
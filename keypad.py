@@ -0,0 +1,34 @@
+# the keyboard key for every chip8 key 0-F, as pygame key names
+KEYMAPS = {
+    # the hex digits themselves
+    "hex": "0123456789abcdef",
+
+    # the cosmac vip layout on the left of a qwerty keyboard:
+    #   1 2 3 C    1 2 3 4
+    #   4 5 6 D    q w e r
+    #   7 8 9 E    a s d f
+    #   A 0 B F    z x c v
+    "qwerty": "x123qweasdzc4rfv",
+}
+
+
+# pressed state of the 16 keys as a bit mask,
+# updated from key down/up events instead of polling
+class Keypad:
+    def __init__(self, mapping: dict[int, int]):
+        # host key code -> chip8 key
+        self.mapping = mapping
+        self.mask = 0
+
+    def press(self, code):
+        key = self.mapping.get(code)
+        if key is not None:
+            self.mask |= 1 << key
+
+    def release(self, code):
+        key = self.mapping.get(code)
+        if key is not None:
+            self.mask &= ~(1 << key)
+
+    def reset(self):
+        self.mask = 0
@@ -0,0 +1,260 @@
+import argparse, json, os, random, struct, sys, zlib
+from multiprocessing import Pool
+
+from chip8 import Chip8, STATE, E_OPS, F_OPS
+from disasm import disassemble
+from jit import MAX_BLOCK
+
+
+# everything in a snapshot up to the random generator state
+CORE = STATE.size - struct.calcsize("<625I?d")
+
+FIELDS = ["PC", "I", "SP", "delayT", "soundT", "cycles", "frames", "V", "stack", "ram", "screen"]
+
+
+def fingerprint(snapshot: bytes) -> int:
+    return zlib.crc32(memoryview(snapshot)[:CORE])
+
+
+# the fields a fingerprint covers, compared in place. nothing is packed,
+# ram and the screen are compared as whole buffers
+def same(a: Chip8, b: Chip8) -> bool:
+    return (
+        a.regPC == b.regPC and a.regI == b.regI and a.regSP == b.regSP
+        and a.delayT == b.delayT and a.soundT == b.soundT
+        and a.cycles == b.cycles and a.frames == b.frames
+        and a.regV == b.regV and a.stack == b.stack
+        and a.screen == b.screen and a.ram == b.ram
+    )
+
+
+# the fields in which two snapshots differ, in a few short lines
+def divergence(ref: bytes, fast: bytes) -> list:
+    a = STATE.unpack(ref)[1:12]
+    b = STATE.unpack(fast)[1:12]
+    lines = []
+
+    for name, x, y in zip(FIELDS, a, b):
+        if x == y:
+            continue
+        if name == "V":
+            lines += [f"V{i:X}: {x[i]:02X} != {y[i]:02X}" for i in range(16) if x[i] != y[i]]
+        elif name == "stack":
+            sx, sy = struct.unpack("<16H", x), struct.unpack("<16H", y)
+            lines.append(f"stack: {' '.join(f'{v:03X}' for v in sx)} != {' '.join(f'{v:03X}' for v in sy)}")
+        elif name == "ram":
+            diff = [i for i in range(0x1000) if x[i] != y[i]]
+            lines.append(f"ram: {len(diff)} bytes, " + " ".join(f"{i:03X}:{x[i]:02X}!={y[i]:02X}" for i in diff[:8]))
+        elif name == "screen":
+            rx, ry = struct.unpack("<32Q", x), struct.unpack("<32Q", y)
+            lines.append("screen rows: " + " ".join(str(i) for i in range(32) if rx[i] != ry[i]))
+        else:
+            lines.append(f"{name}: {x:X} != {y:X}")
+
+    return lines
+
+
+# key masks for every frame, held for a random number of frames
+def inputs(seed, frames):
+    rng = random.Random(seed)
+    keys = 0
+    for _ in range(frames):
+        if rng.random() < 0.05:
+            keys = rng.getrandbits(16) if rng.random() < 0.7 else 0
+        yield keys
+
+
+def report(rom_name, engine, frame, cpu, ref, fast, note=None):
+    pc = STATE.unpack_from(ref)[1]
+    op = (cpu.ram[pc] << 8) | cpu.ram[pc + 1] if pc < 0xFFF else 0
+    return {
+        "rom": rom_name,
+        "engine": engine,
+        "ok": False,
+        "frame": frame,
+        "cycles": cpu.cycles,
+        "reference_pc": f"{pc:03X}  {op:04X}  {disassemble(op)}",
+        "note": note,
+        "diff": divergence(ref, fast) if fast is not None else [],
+    }
+
+
+# runs the interpreter and the jit side by side and compares them after
+# every jit block. frames are cut at the same instruction counts for
+# both, so the timers tick at the same points
+def lockstep_jit(rom, rom_name="rom", seed=0, frames=600, ipf=10):
+    ref = Chip8(rom, ipf=ipf, seed=seed)
+    fast = Chip8(rom, ipf=ipf, seed=seed, jit=True)
+
+    for frame, keys in enumerate(inputs(seed, frames)):
+        ref.keys = fast.keys = keys
+        count = 0
+
+        while count < ipf and not fast.idle:
+            try:
+                k = fast.step(ipf - count)
+            except Exception as e:
+                # a raising block ran up to the raising instruction
+                for _ in range(MAX_BLOCK + 1):
+                    try:
+                        ref.step()
+                    except Exception:
+                        break
+                else:
+                    return report(rom_name, "jit", frame, ref, ref.snapshot(), fast.snapshot(), f"only the jit raised {e!r}")
+
+                a, b = ref.snapshot(), fast.snapshot()
+                if fingerprint(a) != fingerprint(b):
+                    return report(rom_name, "jit", frame, ref, a, b, "both raised, in different states")
+                return {"rom": rom_name, "engine": "jit", "ok": True, "frames": frame, "stopped": repr(e)}
+
+            try:
+                for _ in range(k):
+                    ref.step()
+            except Exception as e:
+                return report(rom_name, "jit", frame, ref, ref.snapshot(), fast.snapshot(), f"only the interpreter raised {e!r}")
+            count += k
+
+            if not same(ref, fast) or ref.idle != fast.idle:
+                note = f"idle: interpreter {ref.idle}, jit {fast.idle}" if ref.idle != fast.idle else None
+                return report(rom_name, "jit", frame, ref, ref.snapshot(), fast.snapshot(), note)
+
+        ref.end_frame(count)
+        fast.end_frame(count)
+
+    return {"rom": rom_name, "engine": "jit", "ok": True, "frames": frames, "stopped": None}
+
+
+# runs both engines through run_frame(), as the frontends do, and
+# compares them at every frame end
+def lockstep_jit_frames(rom, rom_name="rom", seed=0, frames=600, ipf=10):
+    ref = Chip8(rom, ipf=ipf, seed=seed)
+    fast = Chip8(rom, ipf=ipf, seed=seed, jit=True)
+
+    for frame, keys in enumerate(inputs(seed, frames)):
+        ref.keys = fast.keys = keys
+        errors = []
+        for cpu in (ref, fast):
+            try:
+                cpu.run_frame()
+                errors.append(None)
+            except Exception as e:
+                errors.append(repr(e))
+
+        # the jit may word an error differently, only whether both raised counts
+        if (errors[0] is None) != (errors[1] is None):
+            note = f"interpreter {errors[0] or 'running'}, jit {errors[1] or 'running'}"
+            return report(rom_name, "jit-frame", frame, ref, ref.snapshot(), fast.snapshot(), note)
+        if not same(ref, fast) or ref.executed != fast.executed:
+            note = f"executed: interpreter {ref.executed}, jit {fast.executed}" if ref.executed != fast.executed else None
+            return report(rom_name, "jit-frame", frame, ref, ref.snapshot(), fast.snapshot(), note)
+        if errors[0] is not None:
+            return {"rom": rom_name, "engine": "jit-frame", "ok": True, "frames": frame, "stopped": errors[0]}
+
+    return {"rom": rom_name, "engine": "jit-frame", "ok": True, "frames": frames, "stopped": None}
+
+
+# n interpreters against one VectorChip8 of n machines, compared per frame
+def lockstep_vector(rom, rom_name="rom", seed=0, frames=600, ipf=10, n=16):
+    from vector import VectorChip8
+
+    seeds = [seed * n + i for i in range(n)]
+    refs = [Chip8(rom, ipf=ipf, seed=s) for s in seeds]
+    fast = VectorChip8(rom, n, seeds=seeds, ipf=ipf)
+    streams = [inputs(s, frames) for s in seeds]
+    dead = [None] * n
+
+    for frame in range(frames):
+        for m, ref in enumerate(refs):
+            ref.keys = fast.keys[m] = next(streams[m])
+            if dead[m] is None:
+                try:
+                    ref.run_frame()
+                except Exception as e:
+                    dead[m] = repr(e)
+        fast.run_frame()
+
+        for m, ref in enumerate(refs):
+            if (dead[m] is None) == bool(fast.halted[m]):
+                note = f"machine {m}: interpreter {dead[m] or 'running'}, vector {fast.errors[m] or 'running'}"
+                return report(rom_name, "vector", frame, ref, ref.snapshot(), None, note)
+            if dead[m] is None:
+                a, b = ref.snapshot(), fast.snapshot(m)
+                if fingerprint(a) != fingerprint(b):
+                    return report(rom_name, "vector", frame, ref, a, b, f"machine {m}")
+
+    return {"rom": rom_name, "engine": "vector", "ok": True, "frames": frames, "stopped": None}
+
+
+ENGINES = {"jit": lockstep_jit, "jit-frame": lockstep_jit_frames, "vector": lockstep_vector}
+
+
+# random code that mostly decodes to real instructions, with jumps
+# and calls landing inside the rom and loads pointing at it. the last
+# instruction jumps back to the start instead of running off the end
+def random_rom(seed, size=256) -> bytes:
+    rng = random.Random(seed)
+    words = []
+    for _ in range(size // 2 - 1):
+        family = rng.randrange(16)
+        op = (family << 12) | rng.getrandbits(12)
+        if family in (0x1, 0x2, 0xA, 0xB):
+            op = (family << 12) | (0x200 + 2 * rng.randrange(size // 2))
+        elif family == 0x0:
+            op = rng.choice((0x00E0, 0x00EE, 0x0000))
+        elif family == 0x8:
+            op = (op & 0xFFF0) | rng.choice((0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0xE))
+        elif family == 0xE:
+            op = (op & 0xFF00) | rng.choice(list(E_OPS))
+        elif family == 0xF:
+            op = (op & 0xFF00) | rng.choice(list(F_OPS))
+        if rng.random() < 0.01:
+            op = rng.getrandbits(16)
+        words.append(op)
+    words.append(0x1200)
+    return b"".join(w.to_bytes(2, "big") for w in words)
+
+
+def fuzz_one(job):
+    engine, seed, frames, ipf = job
+    return ENGINES[engine](random_rom(seed), f"random:{seed}", seed=seed, frames=frames, ipf=ipf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run the interpreter and a fast engine in lockstep")
+    parser.add_argument("roms", nargs="*")
+    parser.add_argument("--engine", choices=list(ENGINES), default="jit")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--ipf", type=int, default=10, help="instructions per 60 Hz frame")
+    parser.add_argument("--seed", type=int, default=0, help="seed for Cxkk and the generated key input")
+    parser.add_argument("--fuzz", type=int, default=0, metavar="N", help="also run N generated random roms")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes for --fuzz")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.roms:
+        with open(path, "rb") as f:
+            result = ENGINES[args.engine](f.read(), path, seed=args.seed, frames=args.frames, ipf=args.ipf)
+        failed += not result["ok"]
+        sys.stdout.write(json.dumps(result) + "\n")
+
+    if args.fuzz:
+        jobs = [(args.engine, args.seed + i, args.frames, args.ipf) for i in range(args.fuzz)]
+        passed = 0
+        with Pool(args.jobs) as pool:
+            for result in pool.imap_unordered(fuzz_one, jobs):
+                if result["ok"]:
+                    passed += 1
+                else:
+                    failed += 1
+                    sys.stdout.write(json.dumps(result) + "\n")
+                    sys.stdout.flush()
+        sys.stdout.write(f"fuzz: {passed}/{args.fuzz} roms agree\n")
+
+    if failed:
+        exit(1)
+
+
+
+if __name__ == "__main__":
+    main()
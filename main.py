@@ -1,568 +1,121 @@
-import sys, random, os
-os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
-import pygame as pg
-
-from byte import Byte, Short, TypedArray
-
-
-pg.init()
-
-FONT = [
-    # 0
-    0xF0,
-    0x90,
-    0x90,
-    0x90,
-    0xF0,
-
-    # 1
-    0x20,
-    0x60,
-    0x20,
-    0x20,
-    0x70,
-
-    # 2
-    0xF0,
-    0x10,
-    0xF0,
-    0x80,
-    0xF0,
-
-    # 3
-    0xF0,
-    0x10,
-    0xF0,
-    0x10,
-    0xF0,
-
-    # 4
-    0x90,
-    0x90,
-    0xF0,
-    0x10,
-    0x10,
-
-    # 5
-    0xF0,
-    0x80,
-    0xF0,
-    0x10,
-    0xF0,
-
-    # 6
-    0xF0,
-    0x80,
-    0xF0,
-    0x90,
-    0xF0,
-
-    # 7
-    0xF0,
-    0x10,
-    0x20,
-    0x40,
-    0x40,
-
-    # 8
-    0xF0,
-    0x90,
-    0xF0,
-    0x90,
-    0xF0,
-
-    # 9
-    0xF0,
-    0x90,
-    0xF0,
-    0x10,
-    0xF0,
-
-    # A
-    0xF0,
-    0x90,
-    0xF0,
-    0x90,
-    0x90,
-
-    # B
-    0xE0,
-    0x90,
-    0xE0,
-    0x90,
-    0xE0,
-
-    # C
-    0xF0,
-    0x80,
-    0x80,
-    0x80,
-    0xF0,
-
-    # D
-    0xE0,
-    0x90,
-    0x90,
-    0x90,
-    0xE0,
-
-    # E
-    0xF0,
-    0x80,
-    0xF0,
-    0x80,
-    0xF0,
-
-    # F
-    0xF0,
-    0x80,
-    0xF0,
-    0x80,
-    0x80,
-]
-
-def get_key():
-    k = pg.key.get_pressed()
-
-    if k[pg.K_0]:
-        return 0x0
-    elif k[pg.K_1]:
-        return 0x1
-    elif k[pg.K_2]:
-        return 0x2
-    elif k[pg.K_3]:
-        return 0x3
-    elif k[pg.K_4]:
-        return 0x4
-    elif k[pg.K_5]:
-        return 0x5
-    elif k[pg.K_6]:
-        return 0x6
-    elif k[pg.K_7]:
-        return 0x7
-    elif k[pg.K_8]:
-        return 0x8
-    elif k[pg.K_9]:
-        return 0x9
-    elif k[pg.K_a]:
-        return 0xa
-    elif k[pg.K_b]:
-        return 0xb
-    elif k[pg.K_c]:
-        return 0xc
-    elif k[pg.K_d]:
-        return 0xd
-    elif k[pg.K_e]:
-        return 0xe
-    elif k[pg.K_f]:
-        return 0xf
-
-    return None
-
-class Chip8:
-    def __init__(self, rom, scale=10, debug=False):
-        self.ram = TypedArray(Byte, [Byte(0) for _ in range(0x1000)])
-
-        for i, b in enumerate(FONT):
-            self.ram[i] = Byte(b)
-
-        # load the rom
-        for i, b in enumerate(rom):
-            self.ram[0x200 + i] = b
-
-        # the 15 "V" registers
-        self.regV = TypedArray(Byte, [Byte(0) for _ in range(16)])
-
-        # the 16 bit "I" register
-        self.regI = Short(0)
-
-        # program counter
-        self.regPC = Short(0x200)
-
-        # call stack
-        self.stack = TypedArray(Short, [Short(0) for _ in range(16)])
-
-        # stack pointer
-        self.regSP = Byte(0)
-
-        self.delayT = Byte(0)
-        self.soundT = Byte(0)
-
-        # create display
-        self.scale = scale
-        self.display = pg.display.set_mode((64 * scale, 32 * scale))
-
-        self.screen = None
-        self.clear_display()
-
-        self.debug_on = debug
-
-
-    def fetch(self, addr) -> Short:
-        return Short.from_bytes(self.ram[addr], self.ram[addr + 1])
-
-    def execute(self, instr: Short):
-        match instr:
-            # 00E0 clear display
-            case 0x00E0:
-                self.clear_display()
-                self.regPC += 2
-
-            # 00EE return from subroutine
-            case 0x00EE:
-                if self.regSP == 0:
-                    return
-                self.regPC = self.stack[self.regSP]
-                self.regSP -= 1
-                self.regPC += 2
-
-            # 0nnn jump to address (ignored)
-            case x if x & 0xF000 == 0:
-                self.regPC += 2
-
-            # 1nnn jump to address
-            case x if (x & 0xF000) >> 12 == 1:
-                self.regPC = Short(x & 0x0FFF)
-
-            # 2nnn call adress
-            case x if (x & 0xF000) >> 12 == 2:
-                self.regSP += 1
-                self.stack[self.regSP] = self.regPC
-                self.regPC = Short(x & 0x0FFF)
-
-            # 3xkk skip instruction if Vx == kk
-            case x if (x & 0xF000) >> 12 == 3:
-                Vx = Byte(x << 4 >> 12)
-                kk = Byte(x << 8 >> 8)
-                if self.regV[Vx] == kk:
-                    self.regPC += 4
-                else:
-                    self.regPC += 2
-
-            # 4xkk skip instruction if Vx != kk
-            case x if (x & 0xF000) >> 12 == 4:
-                Vx = Byte(x << 4 >> 12)
-                kk = Byte(x << 8 >> 8)
-                if self.regV[Vx] != kk:
-                    self.regPC += 4
-                else:
-                    self.regPC += 2
-
-            # 5xy0 skip instruction if Vx == Vy
-            case x if (x & 0xF000) >> 12 == 5:
-                Vx = Byte(x << 4 >> 12)
-                Vy = Byte(x << 8 >> 12)
-                if self.regV[Vx] == self.regV[Vy]:
-                    self.regPC += 4
-                else:
-                    self.regPC += 2
-
-            # 6xkk set Vx = kk
-            case x if (x & 0xF000) >> 12 == 6:
-                Vx = Byte(x << 4 >> 12)
-                kk = Byte(x << 8 >> 8)
-                self.regV[Vx] = kk
-
-                self.regPC += 2
-
-            # 7xkk add kk to Vx
-            case x if (x & 0xF000) >> 12 == 7:
-                Vx = Byte(x << 4 >> 12)
-                kk = Byte(x << 8 >> 8)
-                self.regV[Vx] += kk
-
-                self.regPC += 2
-
-            # 8xy? operators
-            case x if (x & 0xF000) >> 12 == 8:
-                Vx = Byte(x << 4 >> 12)
-                Vy = Byte(x << 8 >> 12)
-
-                op = Byte(x & 0x000F)
-
-                match op:
-                    case 0: # assign
-                        self.regV[Vx] = self.regV[Vy]
-                    case 1: # OR
-                        self.regV[Vx] = self.regV[Vx] | self.regV[Vy]
-                    case 2: # AND
-                        self.regV[Vx] = self.regV[Vx] & self.regV[Vy]
-                    case 3: # XOR
-                        self.regV[Vx] = self.regV[Vx] ^ self.regV[Vy]
-                    case 4: # ADD
-                        self.regV[Vx] = self.regV[Vx] + self.regV[Vy]
-                        self.regV[0xF] = Byte(1) if self.regV[Vx].wrapped else Byte(0)
-
-                    case 5: # SUB
-                        self.regV[Vx] = self.regV[Vx] - self.regV[Vy]
-                        self.regV[0xF] = Byte(1) if not self.regV[Vx].wrapped else Byte(0)
-
-                    case 6: # SHR
-                        self.regV[0xF] = Byte(1) if self.regV[Vx] & 1 == 1 else Byte(0)
-                        self.regV[Vx] //= 2
-
-                    case 7: # SUBN
-                        self.regV[Vx] = self.regV[Vy] - self.regV[Vx]
-                        self.regV[0xF] = Byte(1) if not self.regV[Vx].wrapped else Byte(0)
-
-                    case 0xE: # SHL
-                        self.regV[0xF] = Byte(1) if self.regV[Vx] & (1 << 7) == 1 else Byte(0)
-                        self.regV[Vx] *= 2
-
-                self.regPC += 2
-
-            # 9xy0 skip instrction if Vx != Vy
-            case x if (x & 0xF000) >> 12 == 9:
-                Vx = Byte(x << 4 >> 12)
-                Vy = Byte(x << 8 >> 12)
-                if self.regV[Vx] != self.regV[Vy]:
-                    self.regPC += 4
-                else:
-                    self.regPC += 2
-
-            # Annn set reg I to nnn
-            case x if (x & 0xF000) >> 12 == 0xA:
-                self.regI = x << 4 >> 4
-                self.regPC += 2
-
-            # Bnnn jmp to nnn + reg V0
-            case x if (x & 0xF000) >> 12 == 0xB:
-                self.regPC = Short(x & 0x0FFF) + self.regV[0]
-
-            # Cxkk Vx = random byte & kk
-            case x if (x & 0xF000) >> 12 == 0xC:
-                Vx = Byte(x << 4 >> 12)
-                rnd = Byte(random.randint(0, 255))
-                self.regV[Vx] = rnd & x << 8 >> 8
-                self.regPC += 2
-
-            # Dxyn draw sprite
-            case x if (x & 0xF000) >> 12 == 0xD:
-                Sx = Byte((x & 0x0F00) >> 8)
-                Sy = Byte((x & 0x00F0) >> 4)
-                Sn = Byte(x & 0x000F)
-
-                self.draw_sprite(self.ram[self.regI:self.regI+Sn], int(self.regV[Sx]), int(self.regV[Sy]))
-
-                self.regPC += 2
-
-            # Ex9E skip if key is pressed
-            case x if (x & 0xF0FF) == 0xE09E:
-                Vx = Byte(x << 4 >> 12)
-                k = get_key()
-                if k and k == self.regV[Vx]:
-                    self.regPC += 4
-                else:
-                    self.regPC += 2
-
-            # ExA1 skip if key is not pressed
-            case x if (x & 0xF0FF) == 0xE0A1:
-                Vx = Byte(x << 4 >> 12)
-                k = get_key()
-                if k and k != self.regV[Vx]:
-                    self.regPC += 4
-                else:
-                    self.regPC += 2
-
-            # Fx07 Vx = DT
-            case x if (x & 0xF0FF) == 0xF007: 
-                Vx = Byte(x << 4 >> 12)
-                self.regV[Vx] = self.delayT
-                self.regPC += 2
-
-            # Fx0A wait for key, store it in Vx
-            case x if (x & 0xF0FF) == 0xF00A:
-                Vx = Byte(x << 4 >> 12)
-                k = get_key()
-
-                if not k is None:
-                    self.regV[Vx] = Byte(k)
-                    self.regPC += 2
-
-            # Fx15 Vx = Delay timer     Ich hab keine ahnung ob das hier sinn macht
-            #                           mein ausbilder zwingt mich übrigens dazu meine docs, kommentare und generell alles auf deutsch zu schreiben
-            case x if (x & 0xF0FF) == 0xF015:
-                Vx = Byte(x << 4 >> 12)
-                self.delayT = self.regV[Vx]
-                self.regPC += 2
-
-            # Fx18 soundT = Vx
-            case x if (x & 0xF0FF) == 0xF018:
-                Vx = Byte(x << 4 >> 12)
-                self.soundT = self.regV[Vx]
-                self.regPC += 2
-
-            # Fx1E I += Vx
-            case x if (x & 0xF0FF) == 0xF01E:
-                Vx = Byte(x << 4 >> 12)
-                self.regI = self.regI + self.regV[Vx]
-                self.regPC += 2
-
-            # Fx29 load glyph from font data corresponding to Vx
-            case x if (x & 0xF0FF) == 0xF029:
-                Vx = Byte(x << 4 >> 12)
-                # each glyph is 5 bytes,
-                # the font data is stored at address 0
-                # Vx = wievieltes sprite
-                self.regI = Short(self.regV[Vx] * 5)
-                self.regPC += 2
-
-            # Fx33 store decimal representation of Vx at I, I+1 and I+2
-            case x if (x & 0xF0FF) == 0xF033:
-                Vx = Byte(x << 4 >> 12)
-                s = "{:03}".format(Vx.num)
-
-                self.ram[self.regI] = Byte(int(s[0]))
-                self.ram[self.regI+1] = Byte(int(s[1]))
-                self.ram[self.regI+2] = Byte(int(s[2]))
-
-                self.regPC += 2
-
-
-            # Fx55 store V0 - Vx in memory
-            case x if (x & 0xF0FF) == 0xF055:
-                Vx = Byte(x << 4 >> 12)
-                for i in range(Vx):
-                    self.ram[self.regI+i] = self.regV[i]
-
-                self.regPC += 2
-
-            # Fx65 
-            case x if (x & 0xF0FF) == 0xF065:
-                Vx = Byte(x << 4 >> 12)
-                for i in range(Vx):
-                    self.regV[i] = self.ram[self.regI+i]
-
-                self.regPC += 2
-
-
-            case x:
-                raise Exception("unimplemented: ", hex(x)[2:])
-
-
-    def run(self):
-        clock = pg.time.Clock()
-        acc = 0
-        running = True
-
-        if self.debug_on:
-            self.debug()
-
-        while running:
-            acc += clock.get_time()
-
-            if acc >= 17:
-                if self.delayT > 0:
-                    self.delayT -= 1
-                if self.soundT > 0:
-                    self.soundT -= 1
-
-            instr = self.fetch(self.regPC)
-
-            for event in pg.event.get():
-                if event.type == pg.QUIT:
-                    running = False
-
-            self.execute(instr)
-
-            pg.display.flip()
-
-            if self.debug_on:
-                self.debug(instr)
-
-        clock.tick(60)
-
-
-    def draw_sprite(self, sprite, x, y):
-        sy = 0
-        for byte in sprite:
-            sx = 0
-            for bit in reversed(range(8)):
-                if (byte >> bit) & 1 == 1:
-                    self.toggle_pixel(x + sx, y + sy)
-                sx += 1
-            sy += 1
-
-
-    def toggle_pixel(self, x, y):
-        rect = pg.Rect(x * self.scale, y * self.scale, self.scale, self.scale)
-
-        self.regV[0xF] = Byte(0)
-
-        if self.screen[x][y]:
-            self.regV[0xF] = Byte(1)
-            pg.draw.rect(self.display, "black", rect)
-        else:
-            pg.draw.rect(self.display, "white", rect)
-
-        self.screen[x][y] = not self.screen[x][y]
-
-
-    def clear_display(self):
-        self.screen = []
-        for _ in range(64):
-            self.screen.append([False]*32)
-        self.display.fill("black")
-
-
-    last_instr = None
-    inst_count = 0
-
-    def debug(self, instr: Short | None = None):
-        lines = 7
-        if not self.last_instr:
-            sys.stdout.write("\n"*(lines+1))
-        sys.stdout.write("\033[F"*lines)
-
-        if instr:
-            self.inst_count += 1
-
-        def black(s: str):
-            return "\x1b[30m" + s + "\x1b[0m"
-
-        # instructions
-        sys.stdout.write(black("count: ") + str(self.inst_count) + "\n")
-        sys.stdout.write(black(str(self.last_instr if self.last_instr else "    ")) + " ")
-        sys.stdout.write("\x1b[30;42m" + str(instr if instr else "....") + "\x1b[0m ")
-        sys.stdout.write(black(str(self.fetch(self.regPC))))
-        sys.stdout.write("\n")
-
-        # registers
-        sys.stdout.write(black("PC: ") + repr(self.regPC) + black(" I: ") + repr(self.regI) + black(" SP: ") + str(self.regSP))
-        sys.stdout.write("\n\n")
-
-        for i, vreg in enumerate(self.regV):
-            sys.stdout.write(black("V" + "{:01X}".format(i) + ":") + " " + str(vreg) + " ")
-            if i == 7:
-                sys.stdout.write("\n")
-        sys.stdout.write("\n\n")
-
-        sys.stdout.write(black("stack: "))
-        if self.regSP == 0:
-            sys.stdout.write("empty                                     ")
-        for i in range(self.regSP):
-            sys.stdout.write(str(self.stack[i]) + " ")
-
-
-        sys.stdout.flush()
-
-        self.last_instr = instr if instr else "...."
-        #breakpoint()
+import argparse, random, sys
 
+import cache
+from audio import AUDIO, get_audio
+from chip8 import Chip8
+from frontend import FRONTENDS, get_frontend
+from keypad import KEYMAPS
 
 
 def main():
-    rom = None
-
-    if len(sys.argv) < 2:
-        print("ERROR: Expected input ROM")
-        exit(1)
-
-    with open(sys.argv[1], "rb") as f:
-        rom = [Byte(x) for x in f.read()]
-
-    cpu = Chip8(rom, debug=True)
-    cpu.run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom")
+    parser.add_argument("--frontend", choices=FRONTENDS, default="pygame")
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--keymap", choices=list(KEYMAPS), default="hex")
+    parser.add_argument("--audio", choices=AUDIO, default=None, help="buzzer backend, pygame with the pygame frontend by default")
+    parser.add_argument("--audio-stats", action="store_true", help="print buzzer statistics at exit")
+    parser.add_argument("--cycles", type=int, default=None, help="stop after this many instructions")
+    parser.add_argument("--ipf", type=int, default=10, help="instructions per 60 Hz frame")
+    parser.add_argument("--turbo", action="store_true", help="run uncapped, skipping render frames")
+    parser.add_argument("--threaded", action="store_true", help="emulate on a separate thread from events and rendering")
+    parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--jit", action="store_true")
+    parser.add_argument("--precompile", action="store_true", help="with --jit, translate every analyzed block before starting")
+    parser.add_argument("--cache", action="store_true", help="with --jit, reuse and keep compiled blocks between runs")
+    parser.add_argument("--profile", action="store_true", help="print an execution profile at exit")
+    parser.add_argument("--profile-json", metavar="PATH", help="write the execution profile as json")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the Cxkk random generator")
+    parser.add_argument("--record", metavar="PATH", help="record key input for a later replay")
+    parser.add_argument("--replay", metavar="PATH", help="play back recorded key input")
+    parser.add_argument("--rewind", type=int, default=0, metavar="SECONDS", help="keep a rewind history, hold backspace to rewind")
+    parser.add_argument("--trace", metavar="PATH", help="record a binary execution trace")
+    parser.add_argument("--trace-size", type=int, default=1 << 20, help="records kept in the trace ring buffer")
+    parser.add_argument("--trace-stream", action="store_true", help="write the whole trace instead of the last records")
+    parser.add_argument("--shm", metavar="NAME", help="publish the machine state in shared memory for shm.py")
+    args = parser.parse_args()
+
+    with open(args.rom, "rb") as f:
+        rom = f.read()
+
+    seed = args.seed if args.seed is not None else random.getrandbits(63)
+    cycles = args.cycles
+
+    recorder = None
+    if args.replay:
+        from replay import InputReplay
+        log = InputReplay(args.replay)
+        cpu = log.machine(rom)
+        cpu.debug_on = args.debug
+        log.attach(cpu)
+        cycles = log.end
+    else:
+        cpu = Chip8(rom, debug=args.debug, jit=args.jit, ipf=args.ipf, seed=seed)
+        if args.record:
+            from replay import InputRecorder
+            recorder = InputRecorder(args.record, rom, seed)
+            recorder.attach(cpu)
+
+    # a missing audio device is not worth failing over
+    try:
+        cpu.audio = get_audio(args.audio or ("pygame" if args.frontend == "pygame" else "null"))
+    except RuntimeError as e:
+        print(f"no audio: {e}", file=sys.stderr)
+
+    use_cache = cpu.blocks is not None and args.cache
+    if use_cache:
+        cache.load_blocks(rom, cpu)
+
+    if args.precompile and cpu.blocks is not None:
+        from analyze import load_analysis
+        cpu.blocks.precompile(cpu, [b["start"] for b in load_analysis(rom)["blocks"]])
+
+    profiler = None
+    if args.profile or args.profile_json:
+        from profiler import Profiler
+        profiler = Profiler()
+        profiler.attach(cpu)
+
+    rewind = None
+    if args.rewind:
+        from rewind import Rewind
+        rewind = Rewind(args.rewind)
+
+    tracer = None
+    if args.trace:
+        from tracer import Tracer
+        tracer = Tracer(args.trace, args.trace_size, stream=args.trace_stream)
+        tracer.attach(cpu)
+
+    export = None
+    if args.shm:
+        from shm import SharedExport
+        export = SharedExport(args.shm)
+        export.attach(cpu)
+
+    try:
+        frontend = get_frontend(args.frontend, args.scale, args.keymap)
+        if args.threaded:
+            from threaded import ThreadedRunner
+            ThreadedRunner(cpu, frontend, cycles=cycles, turbo=args.turbo, rewind=rewind).run()
+        else:
+            cpu.run(frontend, cycles=cycles, turbo=args.turbo, rewind=rewind)
+    finally:
+        if profiler and args.profile:
+            print(profiler.report())
+        if profiler and args.profile_json:
+            profiler.dump_json(args.profile_json)
+        if tracer:
+            tracer.close()
+        if recorder:
+            recorder.close()
+        if export:
+            export.close()
+        if use_cache:
+            cache.store_blocks(rom, cpu)
+        cpu.audio.close()
+        if args.audio_stats:
+            print(cpu.audio.stats())
 
 
 
@@ -0,0 +1,89 @@
+import sys, os
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+import pygame as pg
+
+from keypad import KEYMAPS, Keypad
+
+
+class PygameFrontend:
+    def __init__(self, scale=10, keymap="hex"):
+        pg.display.init()
+
+        self.scale = scale
+        self.display = pg.display.set_mode((64 * scale, 32 * scale))
+        self.display.fill("black")
+
+        # the framebuffer is uploaded into this 64x32 surface
+        # and then scaled up onto the window
+        self.surface = pg.Surface((64, 32), 0, self.display)
+
+        # raw pixel data for every possible byte of a screen row
+        size = self.surface.get_bytesize()
+        on = self.surface.map_rgb(pg.Color("white")).to_bytes(size, sys.byteorder)
+        off = self.surface.map_rgb(pg.Color("black")).to_bytes(size, sys.byteorder)
+        self.byte_pixels = [b"".join(on if (b >> (7 - i)) & 1 else off for i in range(8)) for b in range(256)]
+        self.padding = bytes(self.surface.get_pitch() - 64 * size)
+
+        self.keypad = Keypad({pg.key.key_code(name): i for i, name in enumerate(KEYMAPS[keymap])})
+
+        # set while backspace is held, see Chip8.run
+        self.rewinding = False
+
+    # the key state only changes through the events drained here
+    def poll(self, cpu) -> bool:
+        for event in pg.event.get():
+            match event.type:
+                case pg.QUIT:
+                    return False
+                case pg.KEYDOWN:
+                    if event.key == pg.K_BACKSPACE:
+                        self.rewinding = True
+                    self.keypad.press(event.key)
+                case pg.KEYUP:
+                    if event.key == pg.K_BACKSPACE:
+                        self.rewinding = False
+                    self.keypad.release(event.key)
+                case pg.WINDOWFOCUSLOST:
+                    # key up events are lost with the focus
+                    self.keypad.reset()
+                    self.rewinding = False
+
+        cpu.keys = self.keypad.mask
+        return True
+
+    # blocks until the next event, which is left for poll()
+    def wait(self):
+        pg.event.post(pg.event.wait())
+
+    # redraws each run of consecutive dirty rows with one upload and one scale
+    def present(self, cpu):
+        dirty = cpu.dirty
+        if not dirty:
+            return
+
+        rects = []
+        y = 0
+        while dirty:
+            # skip clean rows, then find the end of the dirty run
+            skip = (dirty & -dirty).bit_length() - 1
+            y += skip
+            dirty >>= skip
+            run = (~dirty & (dirty + 1)).bit_length() - 1
+            dirty >>= run
+
+            pixels = b"".join(
+                b"".join(map(self.byte_pixels.__getitem__, row.to_bytes(8, "big"))) + self.padding
+                for row in cpu.screen[y:y + run]
+            )
+            self.surface.get_buffer().write(pixels, y * self.surface.get_pitch())
+
+            rect = pg.Rect(0, y * self.scale, 64 * self.scale, run * self.scale)
+            pg.transform.scale(self.surface.subsurface((0, y, 64, run)), rect.size, self.display.subsurface(rect))
+            rects.append(rect)
+            y += run
+
+        pg.display.update(rects)
+        cpu.dirty = 0
+
+    def close(self, cpu):
+        pg.display.quit()
@@ -0,0 +1,129 @@
+import json
+from collections import Counter
+
+from chip8 import Chip8, DECODE
+from jit import MAX_BLOCK
+
+
+# opt-in execution profiler. attaching it hooks step() and run_frame()
+# on that one Chip8 instance, so an unprofiled machine pays nothing
+class Profiler:
+    def __init__(self):
+        self.cpu = None
+
+        # executions per handler, e.g. "drw" or "add_vx_kk"
+        self.ops = Counter()
+
+        # executions per address
+        self.pc_hits = [0] * 0x1000
+
+        self.calls = 0
+        self.returns = 0
+        self.max_depth = 0
+        self.depths = Counter()
+
+        self.frame_draws = 0
+        self.draws_per_frame = Counter()
+
+        self.instructions = 0
+        self.frames = 0
+
+    def attach(self, cpu: Chip8):
+        self.cpu = cpu
+
+        # both chained, other tools may hook steps and frames as well
+        self.next_step = cpu.step
+        cpu.step = self.step
+        self.next_frame = cpu.run_frame
+        cpu.run_frame = self.run_frame
+
+    def detach(self):
+        self.cpu.step = self.next_step
+        self.cpu.run_frame = self.next_frame
+
+
+    def step(self, budget=MAX_BLOCK) -> int:
+        cpu = self.cpu
+        blocks = cpu.blocks
+        pc = cpu.regPC
+
+        if blocks is None:
+            fn = DECODE[cpu.fetch(pc)][0]
+            count = self.next_step(budget)
+            self.record(pc, fn)
+            return count
+
+        # a block always runs straight through, so every instruction in it
+        # is attributed once. decoded up to the block's end before running,
+        # it may rewrite itself
+        block = blocks.blocks.get(pc) or blocks.translate(cpu, pc)
+        fns = [DECODE[cpu.fetch(addr)][0] for addr in range(pc, block[2], 2)]
+        count = self.next_step(budget)
+        for i in range(count):
+            self.record(pc + 2 * i, fns[i])
+        return count
+
+    def record(self, pc, fn):
+        self.instructions += 1
+        self.pc_hits[pc] += 1
+        self.ops[fn.__name__[3:]] += 1
+
+        if fn is Chip8.op_call:
+            self.calls += 1
+            depth = self.cpu.regSP
+            self.depths[depth] += 1
+            self.max_depth = max(self.max_depth, depth)
+        elif fn is Chip8.op_ret:
+            self.returns += 1
+        elif fn is Chip8.op_drw:
+            self.frame_draws += 1
+
+    def run_frame(self) -> int:
+        count = self.next_frame()
+        self.frames += 1
+        self.draws_per_frame[self.frame_draws] += 1
+        self.frame_draws = 0
+        return count
+
+
+    def hotspots(self, top=20):
+        hits = sorted(range(0x1000), key=self.pc_hits.__getitem__, reverse=True)
+        return [(pc, self.pc_hits[pc]) for pc in hits[:top] if self.pc_hits[pc]]
+
+    def to_dict(self) -> dict:
+        draws = sum(d * c for d, c in self.draws_per_frame.items())
+        return {
+            "instructions": self.instructions,
+            "frames": self.frames,
+            "ops": dict(self.ops.most_common()),
+            "pc_hits": {f"{pc:03X}": hits for pc, hits in enumerate(self.pc_hits) if hits},
+            "calls": self.calls,
+            "returns": self.returns,
+            "max_depth": self.max_depth,
+            "call_depths": dict(sorted(self.depths.items())),
+            "draws": draws,
+            "draws_per_frame": dict(sorted(self.draws_per_frame.items())),
+        }
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def report(self, top=10) -> str:
+        total = max(self.instructions, 1)
+        lines = [f"instructions: {self.instructions}  frames: {self.frames}", "", "opcodes:"]
+
+        for name, count in self.ops.most_common(top):
+            lines.append(f"  {name:12} {count:>10}  {count * 100 / total:5.1f}%")
+
+        lines += ["", "hotspots:"]
+        for pc, hits in self.hotspots(top):
+            lines.append(f"  {pc:03X}  {self.cpu.fetch(pc):04X}  {hits:>10}  {hits * 100 / total:5.1f}%")
+
+        draws = sum(d * c for d, c in self.draws_per_frame.items())
+        lines += [
+            "",
+            f"calls: {self.calls}  returns: {self.returns}  max depth: {self.max_depth}",
+            f"draws: {draws}  per frame: {draws / max(self.frames, 1):.2f} avg, {max(self.draws_per_frame, default=0)} max",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,145 @@
+import argparse, hashlib, json, struct, time
+
+from chip8 import Chip8
+
+
+# magic, seed, rom sha1, ipf, jit, cycles at the end of the recording,
+# sha1 of the final snapshot and the number of key events that follow
+HEADER = struct.Struct("<4sQ20sH?Q20sI")
+HEADER_MAGIC = b"C8I2"
+
+# cycle count at the start of a frame and the key mask held from then on
+EVENT = struct.Struct("<QH")
+
+
+def state_hash(cpu) -> bytes:
+    return hashlib.sha1(cpu.snapshot()).digest()
+
+
+# logs every change of the pressed keys against the cycle count of the
+# frame it happened in. hooks run_frame(), so frames the frontend never
+# polled are covered as well
+class InputRecorder:
+    def __init__(self, path, rom, seed):
+        self.path = path
+        self.rom_hash = hashlib.sha1(rom).digest()
+        self.seed = seed
+        self.events = []
+        self.cpu = None
+
+    def attach(self, cpu: Chip8):
+        self.cpu = cpu
+        self.next_frame = cpu.run_frame
+        cpu.run_frame = self.run_frame
+
+    def run_frame(self) -> int:
+        cpu = self.cpu
+        events = self.events
+
+        # after a rewind the recording continues from the restored frame
+        while events and events[-1][0] >= cpu.cycles:
+            events.pop()
+
+        last = events[-1][1] if events else 0
+        if cpu.keys != last:
+            events.append((cpu.cycles, cpu.keys))
+
+        return self.next_frame()
+
+    def close(self):
+        cpu = self.cpu
+        with open(self.path, "wb") as f:
+            f.write(HEADER.pack(
+                HEADER_MAGIC, self.seed, self.rom_hash, cpu.ipf, cpu.blocks is not None,
+                cpu.cycles, state_hash(cpu), len(self.events),
+            ))
+            for cycles, keys in self.events:
+                f.write(EVENT.pack(cycles, keys))
+
+
+# feeds a recorded key log back into a machine, overriding the frontend
+class InputReplay:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        (magic, self.seed, self.rom_hash, self.ipf, self.jit,
+            self.end, self.final_hash, count) = HEADER.unpack_from(data)
+        if magic != HEADER_MAGIC:
+            raise ValueError(f"{path} is not an input recording")
+
+        self.events = list(EVENT.iter_unpack(data[HEADER.size:HEADER.size + count * EVENT.size]))
+        self.index = 0
+        self.keys = 0
+        self.cpu = None
+
+    # a machine set up exactly like the recorded one
+    def machine(self, rom) -> Chip8:
+        if hashlib.sha1(rom).digest() != self.rom_hash:
+            raise ValueError("the recording was made with a different rom")
+        return Chip8(rom, jit=self.jit, ipf=self.ipf, seed=self.seed)
+
+    def attach(self, cpu: Chip8):
+        self.cpu = cpu
+        self.next_frame = cpu.run_frame
+        cpu.run_frame = self.run_frame
+
+    # the replayed mask is set on every frame, a frontend polling the live
+    # keyboard in between must not release keys that are still held
+    def run_frame(self) -> int:
+        cpu = self.cpu
+        events = self.events
+        while self.index < len(events) and events[self.index][0] <= cpu.cycles:
+            self.keys = events[self.index][1]
+            self.index += 1
+        cpu.keys = self.keys
+        return self.next_frame()
+
+    def done(self) -> bool:
+        return self.cpu.cycles >= self.end
+
+
+# replays a recording headless, as fast as possible
+def replay(rom, path) -> dict:
+    log = InputReplay(path)
+    cpu = log.machine(rom)
+    log.attach(cpu)
+
+    start = time.perf_counter()
+    while not log.done():
+        cpu.run_frame()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "cycles": cpu.cycles,
+        "frames": cpu.frames,
+        "seconds": round(elapsed, 6),
+        "realtime": round(cpu.frames / 60 / elapsed, 1) if elapsed > 0 else None,
+        "state": state_hash(cpu).hex(),
+        "match": state_hash(cpu) == log.final_hash,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay an input recording headless at full speed")
+    parser.add_argument("rom")
+    parser.add_argument("recording")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.rom, "rb") as f:
+        rom = f.read()
+
+    ok = True
+    for _ in range(args.repeat):
+        result = replay(rom, args.recording)
+        print(json.dumps(result))
+        ok &= result["match"]
+
+    if not ok:
+        exit(1)
+
+
+
+if __name__ == "__main__":
+    main()
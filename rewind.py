@@ -0,0 +1,36 @@
+import zlib
+from collections import deque
+
+
+def xor(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+# keeps the last `seconds` of machine state at frame granularity.
+# only the newest snapshot is kept in full, every older frame is stored as the
+# compressed xor against its successor, so unchanged bytes cost next to nothing
+class Rewind:
+    def __init__(self, seconds=60, fps=60):
+        self.deltas = deque(maxlen=seconds * fps)
+        self.state = None
+
+    def record(self, cpu):
+        state = cpu.snapshot()
+        if self.state is not None:
+            self.deltas.append(zlib.compress(xor(self.state, state), 1))
+        self.state = state
+
+    # restores the previous frame, returns False when the history is used up
+    def step_back(self, cpu) -> bool:
+        if not self.deltas:
+            return False
+
+        self.state = xor(self.state, zlib.decompress(self.deltas.pop()))
+        cpu.restore(self.state)
+        return True
+
+    def frames(self) -> int:
+        return len(self.deltas)
+
+    def size(self) -> int:
+        return sum(map(len, self.deltas)) + len(self.state or b"")
@@ -0,0 +1,222 @@
+import argparse, asyncio, os, random, struct, sys, time
+
+from chip8 import Chip8
+from rewind import xor
+
+
+# client -> server: magic, seed and the length of the rom name that follows,
+# then a 2 byte key mask whenever the pressed keys change
+HELLO = struct.Struct("<4sQH")
+HELLO_MAGIC = b"C8N1"
+KEYS = struct.Struct("<H")
+
+# server -> client: frame number and payload length, then the screen
+# xor-ed with the previously sent one, run-length encoded
+FRAME = struct.Struct("<IH")
+
+SCREEN_SIZE = 32 * 8
+BLANK_SCREEN = bytes(SCREEN_SIZE)
+
+
+# the xor of two similar screens is mostly zeros: it is stored as pairs of
+# a zero run and a literal run, each at most 255 long, then the literals
+def rle_encode(data: bytes) -> bytes:
+    out = bytearray()
+    i = 0
+    n = len(data)
+    while i < n:
+        start = i
+        while i < n and i - start < 255 and not data[i]:
+            i += 1
+        zeros = i - start
+
+        start = i
+        while i < n and i - start < 255 and data[i]:
+            i += 1
+        out.append(zeros)
+        out.append(i - start)
+        out += data[start:i]
+    return bytes(out)
+
+def rle_decode(data: bytes, size=SCREEN_SIZE) -> bytes:
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        zeros, literals = data[i], data[i + 1]
+        out += bytes(zeros)
+        out += data[i + 2:i + 2 + literals]
+        i += 2 + literals
+    if len(out) != size:
+        raise ValueError("corrupt frame")
+    return bytes(out)
+
+
+# one machine and the connection watching it
+class Session:
+    def __init__(self, rom, seed, ipf, writer):
+        self.cpu = Chip8(rom, ipf=ipf, seed=seed)
+        self.writer = writer
+        self.keys = 0
+        self.sent = BLANK_SCREEN
+        self.bytes = 0
+
+    async def read_keys(self, reader):
+        while True:
+            self.keys, = KEYS.unpack(await reader.readexactly(KEYS.size))
+
+    # steps the machine one frame per 1/60 s. a frame is only sent when the
+    # screen changed and the client keeps up, later deltas catch up on it
+    async def run(self, limit):
+        cpu = self.cpu
+        transport = self.writer.transport
+        frame = 1 / 60
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+
+        while not transport.is_closing():
+            cpu.keys = self.keys
+            cpu.run_frame()
+
+            if cpu.dirty and transport.get_write_buffer_size() < limit:
+                screen = cpu.screen.tobytes()
+                payload = rle_encode(xor(self.sent, screen))
+                self.writer.write(FRAME.pack(cpu.frames, len(payload)) + payload)
+                self.bytes += FRAME.size + len(payload)
+                self.sent = screen
+                cpu.dirty = 0
+
+            deadline += frame
+            now = loop.time()
+            if deadline < now - frame:
+                deadline = now
+            await asyncio.sleep(max(0, deadline - now))
+
+
+class Server:
+    def __init__(self, roms, ipf=10, limit=1 << 16):
+        self.roms = roms
+        self.ipf = ipf
+        self.limit = limit
+        self.sessions = set()
+
+    async def handle(self, reader, writer):
+        session = None
+        tasks = set()
+        try:
+            magic, seed, length = HELLO.unpack(await reader.readexactly(HELLO.size))
+            name = (await reader.readexactly(length)).decode()
+            if magic != HELLO_MAGIC or name not in self.roms:
+                return
+
+            session = Session(self.roms[name], seed, self.ipf, writer)
+            self.sessions.add(session)
+
+            # the session ends with whichever side stops first, reading
+            # keys stops when the client goes away
+            tasks = {
+                asyncio.create_task(session.run(self.limit)),
+                asyncio.create_task(session.read_keys(reader)),
+            }
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"session failed: {e!r}", file=sys.stderr)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.sessions.discard(session)
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# a stand-in viewer: decodes the stream into its own copy of the screen
+# and presses random keys now and then
+async def client(host, port, name, seed=0, seconds=5.0, show=False):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(HELLO.pack(HELLO_MAGIC, seed, len(name.encode())) + name.encode())
+
+    rng = random.Random(seed)
+    screen = BLANK_SCREEN
+    frames = 0
+    received = 0
+    last = 0
+    end = time.perf_counter() + seconds
+
+    try:
+        while time.perf_counter() < end:
+            try:
+                header = await asyncio.wait_for(reader.readexactly(FRAME.size), end - time.perf_counter())
+            except asyncio.TimeoutError:
+                break
+            last, length = FRAME.unpack(header)
+            screen = xor(screen, rle_decode(await reader.readexactly(length)))
+            frames += 1
+            received += FRAME.size + length
+
+            if rng.random() < 0.05:
+                writer.write(KEYS.pack(rng.getrandbits(16) if rng.random() < 0.5 else 0))
+
+            if show:
+                from frontend import draw
+                sys.stdout.write("\x1b[H" + draw(struct.unpack("<32Q", screen)) + "\n")
+    except asyncio.IncompleteReadError:
+        pass
+    finally:
+        writer.close()
+
+    return {
+        "rom": name,
+        "updates": frames,
+        "last_frame": last,
+        "bytes": received,
+        "bytes_per_update": round(received / max(frames, 1), 1),
+        "full_frame_bytes": FRAME.size + SCREEN_SIZE,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="host chip8 sessions over tcp")
+    parser.add_argument("roms", nargs="+")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--ipf", type=int, default=10, help="instructions per 60 Hz frame")
+    parser.add_argument("--client", type=int, default=0, metavar="N", help="connect N test clients to a running server instead")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long test clients watch")
+    parser.add_argument("--show", action="store_true", help="draw the screen of the first test client")
+    args = parser.parse_args()
+
+    if args.client:
+        names = [os.path.basename(path) for path in args.roms]
+
+        async def clients():
+            return await asyncio.gather(*(
+                client(args.host, args.port, names[i % len(names)], seed=i, seconds=args.seconds, show=args.show and i == 0)
+                for i in range(args.client)
+            ))
+
+        for result in asyncio.run(clients()):
+            print(result)
+        return
+
+    roms = {}
+    for path in args.roms:
+        with open(path, "rb") as f:
+            roms[os.path.basename(path)] = f.read()
+
+    try:
+        asyncio.run(Server(roms, args.ipf).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse, struct, sys, time
+from multiprocessing import resource_tracker, shared_memory
+
+from chip8 import Chip8
+from frontend import draw
+
+
+# sequence counter, odd while the writer is in the middle of an update
+SEQ = struct.Struct("<Q")
+
+# frames, cycles, PC, I, keys, SP, delay and sound timer, V0-VF
+FIELDS = struct.Struct("<QQHHHBBB16s")
+
+FIELDS_AT = 8
+SCREEN_AT = 64
+SIZE = SCREEN_AT + 32 * 8
+
+
+# publishes a machine's state into a shared memory segment after every frame.
+# readers in other processes see it without any serialization, the sequence
+# counter tells them whether what they read was torn by a concurrent update
+class SharedExport:
+    def __init__(self, name=None):
+        self.shm = shared_memory.SharedMemory(name, create=True, size=SIZE)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.screen = self.buf[SCREEN_AT:SIZE].cast("Q")
+        self.seq = 0
+        self.cpu = None
+
+    def attach(self, cpu: Chip8):
+        self.cpu = cpu
+        self.next_frame = cpu.run_frame
+        cpu.run_frame = self.run_frame
+        # rewinding restores earlier frames without running them
+        self.next_restore = cpu.restore
+        cpu.restore = self.restore
+        self.publish()
+
+    def run_frame(self) -> int:
+        count = self.next_frame()
+        self.publish()
+        return count
+
+    def restore(self, blob):
+        self.next_restore(blob)
+        self.publish()
+
+    def publish(self):
+        cpu = self.cpu
+        buf = self.buf
+
+        self.seq += 1
+        SEQ.pack_into(buf, 0, self.seq)
+
+        FIELDS.pack_into(
+            buf, FIELDS_AT, cpu.frames, cpu.cycles, cpu.regPC, cpu.regI, cpu.keys,
+            cpu.regSP, cpu.delayT, cpu.soundT, cpu.regV,
+        )
+        # always copied, cpu.dirty belongs to the frontend and may
+        # already be cleared. 256 bytes cost less than tracking it
+        self.screen[:] = cpu.screen
+
+        self.seq += 1
+        SEQ.pack_into(buf, 0, self.seq)
+
+    def close(self):
+        self.screen.release()
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+# attaches to a segment published by SharedExport
+class SharedView:
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name)
+        # the segment belongs to the writer, keep the tracker of this
+        # process from unlinking it when we exit
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        self.buf = self.shm.buf
+        # live view of the screen rows, may change while being read
+        self.screen = self.buf[SCREEN_AT:SIZE].cast("Q")
+
+    def version(self) -> int:
+        return SEQ.unpack_from(self.buf, 0)[0]
+
+    # a consistent copy of the state: (frames, cycles, PC, I, keys, SP,
+    # delay timer, sound timer, V, screen bytes)
+    def read(self):
+        buf = self.buf
+        while True:
+            seq = SEQ.unpack_from(buf, 0)[0]
+            if seq & 1:
+                continue
+            fields = FIELDS.unpack_from(buf, FIELDS_AT)
+            screen = bytes(buf[SCREEN_AT:SIZE])
+            if SEQ.unpack_from(buf, 0)[0] == seq:
+                return fields + (screen,)
+
+    def close(self):
+        self.screen.release()
+        self.buf = None
+        self.shm.close()
+
+
+# a dashboard over any number of exported machines
+def main():
+    parser = argparse.ArgumentParser(description="watch machines exported with --shm")
+    parser.add_argument("names", nargs="+")
+    parser.add_argument("--screen", action="store_true", help="draw the screen of the first machine")
+    parser.add_argument("--fps", type=int, default=10)
+    args = parser.parse_args()
+
+    views = [SharedView(name) for name in args.names]
+    last = [None] * len(views)
+    sys.stdout.write("\x1b[2J")
+
+    try:
+        while True:
+            start = time.perf_counter()
+            lines = []
+
+            for i, (name, view) in enumerate(zip(args.names, views)):
+                frames, cycles, pc, regI, keys, sp, delay, sound, V, screen = view.read()
+                fps = 0 if last[i] is None else (frames - last[i]) * args.fps
+                last[i] = frames
+                lines.append(
+                    f"{name:20} frame {frames:>8}  cycles {cycles:>11}  {fps:>5} fps  "
+                    f"PC={pc:03X} I={regI:03X} SP={sp:X} DT={delay:02X} ST={sound:02X} keys={keys:04X}"
+                )
+                if i == 0 and args.screen:
+                    lines.append(draw(struct.unpack("<32Q", screen)))
+
+            sys.stdout.write("\x1b[H" + "\n".join(lines) + "\n")
+            sys.stdout.flush()
+            time.sleep(max(0, 1 / args.fps - (time.perf_counter() - start)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for view in views:
+            view.close()
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import threading, time
+from array import array
+
+from chip8 import ALL_ROWS, BLANK, Chip8
+
+
+# three screens: the emulation thread fills one, the newest complete frame
+# waits in the second and the render thread shows the third. handing a frame
+# over only swaps two indices, neither side ever waits for the other's work
+class TripleBuffer:
+    def __init__(self):
+        self.buffers = [array("Q", BLANK) for _ in range(3)]
+        self.back, self.ready, self.front = 0, 1, 2
+        self.fresh = False
+
+        # rows changed since the render thread last took a frame
+        self.dirty = 0
+        self.lock = threading.Lock()
+
+    def publish(self, screen, dirty):
+        self.buffers[self.back][:] = screen
+        with self.lock:
+            self.back, self.ready = self.ready, self.back
+            self.fresh = True
+            self.dirty |= dirty
+
+    # the newest frame and its dirty rows, or None if nothing changed
+    def take(self):
+        with self.lock:
+            if not self.fresh:
+                return None, 0
+            self.front, self.ready = self.ready, self.front
+            self.fresh = False
+            dirty, self.dirty = self.dirty, 0
+        return self.buffers[self.front], dirty
+
+
+# what the frontend sees of the machine on the render thread
+class FrameView:
+    def __init__(self):
+        self.screen = array("Q", BLANK)
+        self.dirty = ALL_ROWS
+        self.keys = 0
+
+    def pixel(self, x, y) -> int:
+        return (self.screen[y] >> (63 - x)) & 1
+
+
+# runs the machine on its own thread while the calling thread handles
+# events and presents frames, both paced to 60 Hz on their own. the key
+# mask goes to the machine as a plain int and is applied at the start of
+# a frame, so recordings see the same input as in Chip8.run
+class ThreadedRunner:
+    def __init__(self, cpu: Chip8, frontend, cycles=None, turbo=False, rewind=None):
+        self.cpu = cpu
+        self.frontend = frontend
+        self.cycles = cycles
+        self.turbo = turbo
+        self.rewind = rewind
+
+        self.frames = TripleBuffer()
+        self.keys = 0
+        self.running = True
+        self.error = None
+
+    def emulate(self):
+        cpu = self.cpu
+        rewind = self.rewind
+        frame = 1 / 60
+        deadline = time.perf_counter()
+
+        try:
+            if rewind is not None:
+                rewind.record(cpu)
+
+            while self.running and (self.cycles is None or cpu.cycles < self.cycles):
+                cpu.keys = self.keys
+
+                if rewind is not None and self.frontend.rewinding:
+                    rewind.step_back(cpu)
+                else:
+                    cpu.run_frame()
+                    if rewind is not None:
+                        rewind.record(cpu)
+
+                if cpu.dirty:
+                    self.frames.publish(cpu.screen, cpu.dirty)
+                    cpu.dirty = 0
+
+                if self.turbo:
+                    continue
+                deadline += frame
+                now = time.perf_counter()
+                if deadline < now - frame:
+                    deadline = now
+                elif deadline > now:
+                    time.sleep(deadline - now)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.running = False
+
+    def run(self):
+        frontend = self.frontend
+        view = FrameView()
+        frame = 1 / 60
+        deadline = time.perf_counter()
+
+        thread = threading.Thread(target=self.emulate, name="chip8", daemon=True)
+        thread.start()
+
+        try:
+            while self.running:
+                if not frontend.poll(view):
+                    break
+                self.keys = view.keys
+
+                self.show(view)
+
+                deadline += frame
+                now = time.perf_counter()
+                if deadline < now - frame:
+                    deadline = now
+                elif deadline > now:
+                    time.sleep(deadline - now)
+        finally:
+            self.running = False
+            thread.join()
+
+        self.show(view)
+        frontend.close(view)
+
+        if self.error is not None:
+            raise self.error
+
+    def show(self, view):
+        screen, dirty = self.frames.take()
+        if screen is not None:
+            view.screen = screen
+            view.dirty |= dirty
+        self.frontend.present(view)
@@ -0,0 +1,130 @@
+import argparse, queue, struct, sys, threading
+
+from chip8 import Chip8
+from disasm import disassemble
+from jit import MAX_BLOCK
+
+
+# pc, opcode, I after the instruction, first changed V register
+# (0xFF if none) and its new value
+RECORD = struct.Struct("<HHHBB")
+
+MAGIC = b"C8TR\x01"
+
+
+# records every executed instruction into a preallocated ring buffer.
+# by default only the last `capacity` records are kept and written on close(),
+# with `stream` set every full buffer is handed to a writer thread instead.
+# while attached, instructions run through the interpreter even in jit mode.
+# step() is chained, so a profiler attached earlier still sees every step
+class Tracer:
+    def __init__(self, path, capacity=1 << 20, stream=False):
+        self.path = path
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.pos = 0
+        self.wrapped = False
+        self.cpu = None
+
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+
+        self.queue = None
+        self.writer = None
+        if stream:
+            self.queue = queue.Queue()
+            self.writer = threading.Thread(target=self.write_loop, daemon=True)
+            self.writer.start()
+
+    def attach(self, cpu: Chip8):
+        self.cpu = cpu
+        self.next_step = cpu.step
+        cpu.step = self.step
+
+        # without blocks every step below runs a single instruction
+        self.blocks = cpu.blocks
+        cpu.blocks = None
+
+    def detach(self):
+        cpu = self.cpu
+        cpu.step = self.next_step
+        cpu.blocks = self.blocks
+        # stores done by the interpreter did not invalidate any blocks
+        if cpu.blocks is not None:
+            cpu.blocks.invalidate(0, 0x1000)
+
+
+    def step(self, budget=MAX_BLOCK) -> int:
+        cpu = self.cpu
+        buffer = self.buffer
+
+        if self.pos == len(buffer):
+            if self.queue is not None:
+                self.queue.put(bytes(buffer))
+            else:
+                self.wrapped = True
+            self.pos = 0
+
+        pc = cpu.regPC
+        instr = cpu.fetch(pc)
+        pos = self.pos
+        self.pos = pos + RECORD.size
+
+        # written before executing, so an instruction that raises is still traced
+        RECORD.pack_into(buffer, pos, pc, instr, cpu.regI, 0xFF, 0)
+
+        before = bytes(cpu.regV)
+        self.next_step(1)
+
+        V = cpu.regV
+        reg = 0xFF
+        if V != before:
+            reg = next(i for i in range(16) if V[i] != before[i])
+        RECORD.pack_into(buffer, pos, pc, instr, cpu.regI, reg, V[reg] if reg != 0xFF else 0)
+        return 1
+
+
+    def write_loop(self):
+        while (chunk := self.queue.get()) is not None:
+            self.file.write(chunk)
+
+    def close(self):
+        if self.queue is not None:
+            self.queue.put(bytes(self.buffer[:self.pos]))
+            self.queue.put(None)
+            self.writer.join()
+        else:
+            # oldest records first
+            if self.wrapped:
+                self.file.write(self.buffer[self.pos:])
+            self.file.write(self.buffer[:self.pos])
+        self.file.close()
+
+
+def read_trace(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a trace file")
+        data = f.read()
+
+    return RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="decode a binary execution trace")
+    parser.add_argument("trace")
+    parser.add_argument("--last", type=int, default=None, help="only show the last N records")
+    args = parser.parse_args()
+
+    records = list(read_trace(args.trace))
+    if args.last is not None:
+        records = records[-args.last:]
+
+    for pc, instr, regI, reg, value in records:
+        change = f"V{reg:X}={value:02X}" if reg != 0xFF else ""
+        sys.stdout.write(f"{pc:03X}  {instr:04X}  {disassemble(instr):18} I={regI:03X}  {change}\n")
+
+
+
+if __name__ == "__main__":
+    main()
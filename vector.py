@@ -0,0 +1,315 @@
+import random, struct
+
+import numpy as np
+
+from chip8 import FONT, ALL_ROWS, STATE, STATE_MAGIC
+
+
+# runs n machines with the same rom in lockstep. all state lives in numpy
+# arrays with one row per machine, every step fetches the next opcode of
+# every running machine, groups the machines by opcode family and applies
+# each family to its whole group at once. the results match Chip8 in
+# interpreter mode, machines that would raise are halted instead
+class VectorChip8:
+    def __init__(self, rom, n, seeds=None, ipf=10):
+        if len(rom) > 0x1000 - 0x200:
+            raise ValueError(f"rom too large: {len(rom)} bytes")
+
+        self.n = n
+        self.ipf = ipf
+
+        self.ram = np.zeros((n, 0x1000), np.uint8)
+        self.ram[:, :len(FONT)] = FONT
+        self.ram[:, 0x200:0x200 + len(rom)] = np.frombuffer(rom, np.uint8)
+
+        self.V = np.zeros((n, 16), np.uint8)
+        self.I = np.zeros(n, np.int32)
+        self.PC = np.full(n, 0x200, np.int32)
+        self.SP = np.zeros(n, np.int32)
+        self.stack = np.zeros((n, 16), np.int32)
+        self.delayT = np.zeros(n, np.int32)
+        self.soundT = np.zeros(n, np.int32)
+
+        # pressed key mask per machine, like Chip8.keys
+        self.keys = np.zeros(n, np.int32)
+
+        self.screen = np.zeros((n, 32), np.uint64)
+        self.dirty = np.full(n, ALL_ROWS, np.int64)
+
+        self.idle = np.zeros(n, bool)
+        self.waiting = np.zeros(n, bool)
+
+        # machines stopped by an error, and the error
+        self.halted = np.zeros(n, bool)
+        self.errors = [None] * n
+
+        # Cxkk draws from one generator per machine, exactly like Chip8
+        if seeds is None:
+            seeds = [None] * n
+        self.rngs = [random.Random(seed) for seed in seeds]
+
+        self.cycles = np.zeros(n, np.int64)
+        self.frames = 0
+
+
+    def fetch(self, i, addr):
+        return (self.ram[i, addr].astype(np.int32) << 8) | self.ram[i, addr + 1]
+
+    def fail(self, i, error):
+        self.halted[i] = True
+        for m in i:
+            self.errors[m] = error
+
+
+    # one instruction on every machine in `i`
+    def step(self, i):
+        pc = self.PC[i]
+
+        out = pc >= 0xFFF
+        if out.any():
+            self.fail(i[out], "pc out of range")
+            i = i[~out]
+            pc = pc[~out]
+
+        op = self.fetch(i, pc)
+        family = op >> 12
+        for f in np.unique(family):
+            m = family == f
+            FAMILIES[f](self, i[m], op[m], pc[m])
+
+    # see Chip8.run_frame
+    def run_frame(self):
+        for _ in range(self.ipf):
+            i = np.flatnonzero(~self.idle & ~self.halted)
+            if not len(i):
+                break
+            self.step(i)
+
+        self.idle[:] = False
+
+        live = ~self.halted
+        self.delayT[live & (self.delayT > 0)] -= 1
+        self.soundT[live & (self.soundT > 0)] -= 1
+
+        self.cycles[live] += self.ipf
+        self.frames += 1
+
+
+    # 00E0, 00EE and the ignored 0nnn
+    def op_0(self, i, op, pc):
+        cls = i[op == 0x00E0]
+        self.screen[cls] = 0
+        self.dirty[cls] = ALL_ROWS
+
+        ret = i[op == 0x00EE]
+        sp = self.SP[ret]
+        ret, sp = ret[sp != 0], sp[sp != 0]
+        self.PC[ret] = self.stack[ret, sp] + 2
+        self.SP[ret] = sp - 1
+
+        self.PC[i[op != 0x00EE]] += 2
+
+    def op_1(self, i, op, pc):
+        nnn = op & 0xFFF
+        self.idle[i[self.idle_jump(i, pc, nnn)]] = True
+        self.PC[i] = nnn
+
+    # see Chip8.op_jp and Chip8.timer_loop
+    def idle_jump(self, i, pc, target):
+        idle = target == pc
+
+        loop = (pc - 8 <= target) & (target < pc)
+        if loop.any():
+            li, t, p = i[loop], target[loop], pc[loop]
+            first = self.fetch(li, t)
+            reg = (first >> 8) & 0xF
+            ok = (first & 0xF0FF) == 0xF007
+            for k in (1, 2, 3):
+                a = t + 2 * k
+                inside = a < p
+                skip = self.fetch(li, np.minimum(a, 0xFFE))
+                ok &= ~inside | (((skip >> 12) == 0x3) | ((skip >> 12) == 0x4)) & (((skip >> 8) & 0xF) == reg)
+            idle[loop] = ok
+
+        return idle
+
+    def op_2(self, i, op, pc):
+        sp = (self.SP[i] + 1) & 0xF
+        self.SP[i] = sp
+        self.stack[i, sp] = pc
+        self.PC[i] = op & 0xFFF
+
+    def op_3(self, i, op, pc):
+        self.PC[i] = pc + np.where(self.V[i, (op >> 8) & 0xF] == (op & 0xFF), 4, 2)
+
+    def op_4(self, i, op, pc):
+        self.PC[i] = pc + np.where(self.V[i, (op >> 8) & 0xF] != (op & 0xFF), 4, 2)
+
+    def op_5(self, i, op, pc):
+        self.PC[i] = pc + np.where(self.V[i, (op >> 8) & 0xF] == self.V[i, (op >> 4) & 0xF], 4, 2)
+
+    def op_6(self, i, op, pc):
+        self.V[i, (op >> 8) & 0xF] = op & 0xFF
+        self.PC[i] = pc + 2
+
+    def op_7(self, i, op, pc):
+        x = (op >> 8) & 0xF
+        self.V[i, x] = (self.V[i, x] + (op & 0xFF)) & 0xFF
+        self.PC[i] = pc + 2
+
+    # 8xy? operators, grouped once more by operator
+    def op_8(self, i, op, pc):
+        self.PC[i] = pc + 2
+
+        sub = op & 0xF
+        for s in np.unique(sub):
+            m = sub == s
+            j, x, y = i[m], (op[m] >> 8) & 0xF, (op[m] >> 4) & 0xF
+            vx = self.V[j, x].astype(np.int32)
+            vy = self.V[j, y].astype(np.int32)
+
+            match s:
+                case 0x0:
+                    self.V[j, x] = vy
+                case 0x1:
+                    self.V[j, x] = vx | vy
+                case 0x2:
+                    self.V[j, x] = vx & vy
+                case 0x3:
+                    self.V[j, x] = vx ^ vy
+                case 0x4:
+                    r = vx + vy
+                    self.V[j, x] = r & 0xFF
+                    self.V[j, 0xF] = r >> 8
+                case 0x5:
+                    self.V[j, x] = (vx - vy) & 0xFF
+                    self.V[j, 0xF] = vx >= vy
+                case 0x6:
+                    self.V[j, x] = vx >> 1
+                    self.V[j, 0xF] = vx & 1
+                case 0x7:
+                    self.V[j, x] = (vy - vx) & 0xFF
+                    self.V[j, 0xF] = vy >= vx
+                case 0xE:
+                    self.V[j, x] = (vx << 1) & 0xFF
+                    self.V[j, 0xF] = vx >> 7
+
+    def op_9(self, i, op, pc):
+        self.PC[i] = pc + np.where(self.V[i, (op >> 8) & 0xF] != self.V[i, (op >> 4) & 0xF], 4, 2)
+
+    def op_a(self, i, op, pc):
+        self.I[i] = op & 0xFFF
+        self.PC[i] = pc + 2
+
+    def op_b(self, i, op, pc):
+        self.PC[i] = ((op & 0xFFF) + self.V[i, 0]) & 0xFFF
+
+    # every machine has its own generator, so this one stays a loop
+    def op_c(self, i, op, pc):
+        x = (op >> 8) & 0xF
+        for m, reg, kk in zip(i, x, op & 0xFF):
+            self.V[m, reg] = self.rngs[m].randint(0, 255) & kk
+        self.PC[i] = pc + 2
+
+    # see Chip8.draw_sprite, one sprite row of all machines at a time
+    def op_d(self, i, op, pc):
+        n = op & 0xF
+        x = (self.V[i, (op >> 8) & 0xF] & 63).astype(np.uint64)
+        y = (self.V[i, (op >> 4) & 0xF] & 31).astype(np.int32)
+        addr = self.I[i]
+        collision = np.zeros(len(i), np.uint64)
+
+        for r in range(15):
+            m = (r < n) & (y + r < 32) & (addr + r < 0x1000)
+            if not m.any():
+                break
+            j, row_y = i[m], y[m] + r
+            bits = (self.ram[j, addr[m] + r].astype(np.uint64) << np.uint64(56)) >> x[m]
+            row = self.screen[j, row_y]
+            collision[m] |= row & bits
+            self.screen[j, row_y] = row ^ bits
+
+        rows = np.minimum(np.minimum(n, 32 - y), 0x1000 - addr)
+        self.dirty[i] |= (np.int64(1) << (y + rows)) - (np.int64(1) << y)
+        self.V[i, 0xF] = collision != 0
+        self.PC[i] = pc + 2
+
+    def op_e(self, i, op, pc):
+        kk = op & 0xFF
+        pressed = (self.keys[i] >> (self.V[i, (op >> 8) & 0xF] & 0xF)) & 1
+
+        skp = kk == 0x9E
+        self.PC[i[skp]] = pc[skp] + np.where(pressed[skp], 4, 2)
+        sknp = kk == 0xA1
+        self.PC[i[sknp]] = pc[sknp] + np.where(pressed[sknp], 2, 4)
+
+        bad = ~(skp | sknp)
+        if bad.any():
+            self.fail(i[bad], "unimplemented")
+
+    def op_f(self, i, op, pc):
+        kk = op & 0xFF
+        for s in np.unique(kk):
+            m = kk == s
+            j, x, jpc = i[m], (op[m] >> 8) & 0xF, pc[m]
+            vx = self.V[j, x].astype(np.int32)
+
+            match s:
+                case 0x07:
+                    self.V[j, x] = self.delayT[j]
+                case 0x0A:
+                    keys = self.keys[j]
+                    has = keys != 0
+                    lowest = keys & -keys
+                    self.V[j[has], x[has]] = np.log2(lowest[has]).astype(np.int32)
+                    self.waiting[j] = ~has
+                    self.idle[j[~has]] = True
+                    self.PC[j[has]] = jpc[has] + 2
+                    continue
+                case 0x15:
+                    self.delayT[j] = vx
+                case 0x18:
+                    self.soundT[j] = vx
+                case 0x1E:
+                    self.I[j] = (self.I[j] + vx) & 0xFFFF
+                case 0x29:
+                    self.I[j] = (vx & 0xF) * 5
+                case 0x33:
+                    addr = self.I[j]
+                    for k, digit in enumerate((vx // 100, vx // 10 % 10, vx % 10)):
+                        ok = addr + k < 0x1000
+                        self.ram[j[ok], addr[ok] + k] = digit[ok]
+                case 0x55:
+                    addr = self.I[j]
+                    for k in range(16):
+                        ok = (k <= x) & (addr + k < 0x1000)
+                        self.ram[j[ok], addr[ok] + k] = self.V[j[ok], k]
+                case 0x65:
+                    addr = self.I[j]
+                    for k in range(16):
+                        ok = (k <= x) & (addr + k < 0x1000)
+                        self.V[j[ok], k] = self.ram[j[ok], addr[ok] + k]
+                case _:
+                    self.fail(j, "unimplemented")
+                    continue
+
+            self.PC[j] = jpc + 2
+
+
+    # the state of machine m in the Chip8.snapshot() format
+    def snapshot(self, m) -> bytes:
+        _, mt, gauss = self.rngs[m].getstate()
+        return STATE.pack(
+            STATE_MAGIC, int(self.PC[m]), int(self.I[m]), int(self.SP[m]),
+            int(self.delayT[m]), int(self.soundT[m]), int(self.cycles[m]), self.frames,
+            self.V[m].tobytes(), struct.pack("<16H", *self.stack[m].tolist()),
+            self.ram[m].tobytes(), self.screen[m].tobytes(), *mt, gauss is not None, gauss or 0.0,
+        )
+
+
+FAMILIES = [
+    VectorChip8.op_0, VectorChip8.op_1, VectorChip8.op_2, VectorChip8.op_3,
+    VectorChip8.op_4, VectorChip8.op_5, VectorChip8.op_6, VectorChip8.op_7,
+    VectorChip8.op_8, VectorChip8.op_9, VectorChip8.op_a, VectorChip8.op_b,
+    VectorChip8.op_c, VectorChip8.op_d, VectorChip8.op_e, VectorChip8.op_f,
+]